@@ -34,7 +34,7 @@ import logging
 from twisted.internet import defer, task
 from twisted.python import failure
 
-from stompest.error import StompConnectionError, StompFrameError
+from stompest.error import StompConnectionError, StompFrameError, StompProtocolError
 from stompest.protocol import StompSession, StompSpec
 from stompest.util import checkattr
 
@@ -63,6 +63,7 @@ class Stomp(object):
         self._session = StompSession(self._config.version, self._config.check)
 
         self._listenersFactory = listenersFactory or listener.defaultListeners
+        self._streams = {} # subscription token -> body stream factory
         self._protocolCreator = self.protocolCreatorFactory(self._config.uri, endpointFactory or util.endpointFactory)
 
         self.log = logging.getLogger(LOG_CATEGORY)
@@ -157,7 +158,12 @@ class Stomp(object):
             self.add(listener)
 
         try:
-            self._protocol = yield self._protocolCreator.connect(connectTimeout, self._onFrame, self._onConnectionLost)
+            self._protocol = yield self._protocolCreator.connect(
+                connectTimeout, self._onFrame, self._onConnectionLost,
+                lazyHeaders=self._config.lazyHeaders, zeroCopy=self._config.zeroCopy,
+                socketOptions=self._config.socketOptions, spoolSize=self._config.spoolSize, spool=self._config.spool,
+                stream=self._stream,
+            )
         except:
             self._onConnectionLost(failure.Failure())
             yield self.disconnected
@@ -197,10 +203,22 @@ class Stomp(object):
     def send(self, destination, body=b'', headers=None, receipt=None):
         """send(destination, body=b'', headers=None, receipt=None)
 
-        Send a **SEND** frame.
+        Send a **SEND** frame. Instead of a **destination**, you may pass a :class:`~.StompSendTemplate` which pre-renders the destination and the headers common to many frames. A large **body** may be a file object or an :class:`mmap.mmap`, which is streamed to the wire without being read into memory (see :func:`~.commands.send`).
         """
         yield self.sendFrame(self.session.send(destination, body, headers, receipt))
 
+    @connected
+    @defer.inlineCallbacks
+    def sendMany(self, destination, bodies=None, headers=None):
+        """sendMany(destination, bodies=None, headers=None)
+
+        Send a batch of **SEND** frames, all of which are written to the transport at once. The parameters are the same as for :meth:`~.StompSession.sendMany`. The listeners are notified of each frame after the whole batch has been written.
+        """
+        frames = self.session.sendMany(destination, bodies, headers)
+        self._protocol.sendMany(frames)
+        for frame in frames:
+            yield self._notify(lambda l: l.onSend(self, frame))
+
     @connected
     @defer.inlineCallbacks
     def ack(self, frame, receipt=None):
@@ -248,16 +266,21 @@ class Stomp(object):
 
     @connected
     @defer.inlineCallbacks
-    def subscribe(self, destination, headers=None, receipt=None, listener=None):
-        """subscribe(destination, headers=None, receipt=None, listener=None)
+    def subscribe(self, destination, headers=None, receipt=None, listener=None, stream=None):
+        """subscribe(destination, headers=None, receipt=None, listener=None, stream=None)
 
         :param listener: An optional :class:`~.Listener` object which will be added to this connection to handle events associated to this subscription.
+        :param stream: An optional callable :obj:`f(frame)` (typically a subclass of :class:`~.StompBodyStream`) which is called from :meth:`~.async.protocol.StompProtocol.dataReceived` as soon as the headers of a **MESSAGE** frame for this subscription have been received. The body is handed to the object it returns chunk by chunk while it arrives, and the frame is then handled as usual, but with an empty body (cf. the **stream** parameter of :class:`~.StompParser`).
         
         Send a **SUBSCRIBE** frame to subscribe to a STOMP destination. The callback value of the :class:`twisted.internet.defer.Deferred` which this method returns is a token which is used internally to match incoming **MESSAGE** frames and must be kept if you wish to :meth:`~.async.client.Stomp.unsubscribe` later.
         """
         frame, token = self.session.subscribe(destination, headers, receipt, listener)
         if listener:
             self.add(listener)
+        if stream:
+            self._streams[token] = stream
+        else: # a previous subscription with the same token may have had a stream
+            self._streams.pop(token, None)
         yield self._notify(lambda l: l.onSubscribe(self, frame, l))
         yield self.sendFrame(frame)
         defer.returnValue(token)
@@ -273,6 +296,7 @@ class Stomp(object):
         """
         context = self.session.subscription(token)
         frame = self.session.unsubscribe(token, receipt)
+        self._streams.pop(token, None)
         yield self.sendFrame(frame)
         yield self._notify(lambda l: l.onUnsubscribe(self, frame, context))
 
@@ -342,11 +366,26 @@ class Stomp(object):
     @defer.inlineCallbacks
     def _onConnectionLost(self, reason):
         self._protocol = None
-        yield self._notify(lambda l: l.onConnectionLost(self, reason))
+        try:
+            yield self._notify(lambda l: l.onConnectionLost(self, reason))
+        finally: # forget the streams of the subscriptions which the session has flushed
+            tokens = set(token for (token, _, _, _) in self.session.subscriptions())
+            self._streams = dict((token, stream) for (token, stream) in self._streams.items() if token in tokens)
+
+    def _stream(self, frame):
+        if (frame.command != StompSpec.MESSAGE) or not self._streams:
+            return
+        try:
+            stream = self._streams.get(self.session.message(frame))
+        except StompProtocolError: # not a message for an active subscription
+            return
+        return stream and stream(frame)
 
     def _replay(self):
+        streams = [self._streams.get(token) for (token, _, _, _) in self.session.subscriptions()] # in the order of replay
+        self._streams = {}
         def replay():
-            for (destination, headers, receipt, context) in self.session.replay():
+            for ((destination, headers, receipt, context), stream) in zip(self.session.replay(), streams):
                 self.log.info('Replaying subscription: %s' % headers)
-                yield self.subscribe(destination, headers=headers, receipt=receipt, listener=context)
+                yield self.subscribe(destination, headers=headers, receipt=receipt, listener=context, stream=stream)
         return task.cooperate(replay()).whenDone()
@@ -2,9 +2,10 @@ import logging
 
 from twisted.internet import defer, reactor, task
 from twisted.internet.protocol import Factory, Protocol
+from twisted.protocols.basic import FileSender
 
-from stompest._backwards import binaryType
-from stompest.protocol import StompFailoverTransport, StompParser
+from stompest._backwards import binaryBuffers
+from stompest.protocol import StompFailoverTransport, StompFileBody, StompParser
 
 LOG_CATEGORY = __name__
 
@@ -12,6 +13,10 @@ class StompProtocol(Protocol):
     #
     # twisted.internet.Protocol interface overrides
     #
+    def connectionMade(self):
+        self._setSocketOptions()
+        Protocol.connectionMade(self)
+
     def connectionLost(self, reason):
         try:
             self._onConnectionLost(reason)
@@ -28,10 +33,12 @@ class StompProtocol(Protocol):
             except Exception as e:
                 self.log.error('Unhandled error in frame handler: %s' % e)
 
-    def __init__(self, onFrame, onConnectionLost):
+    def __init__(self, onFrame, onConnectionLost, lazyHeaders=False, zeroCopy=False, socketOptions=None, spoolSize=None, spool=None, stream=None):
         self._onFrame = onFrame
         self._onConnectionLost = onConnectionLost
-        self._parser = StompParser()
+        self._socketOptions = socketOptions or []
+        self._pending = None # the buffers which are queued while a file body is being streamed
+        self._parser = StompParser(lazyHeaders=lazyHeaders, zeroCopy=zeroCopy, spoolSize=spoolSize, spool=spool, stream=stream)
 
         # leave the logger public in case the user wants to override it
         self.log = logging.getLogger(LOG_CATEGORY)
@@ -45,11 +52,78 @@ class StompProtocol(Protocol):
     def send(self, frame):
         if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug('Sending %s' % frame.info())
-        self.transport.write(binaryType(frame))
+        self._write(frame.buffers())
+
+    def sendMany(self, frames):
+        if self.log.isEnabledFor(logging.DEBUG):
+            for frame in frames:
+                self.log.debug('Sending %s' % frame.info())
+        self._write([data for frame in frames for data in frame.buffers()])
 
     def setVersion(self, version):
         self._parser.version = version
 
+    #
+    # private helpers
+    #
+    def _abort(self, message):
+        self._pending = None
+        self.log.error('Could not stream frame body, dropping connection [%s]' % message)
+        self.transport.abortConnection() # the frame on the wire is incomplete, so neither it nor the frames queued after it can be delivered
+
+    def _setSocketOptions(self):
+        if not self._socketOptions:
+            return
+        transport = self.transport
+        while transport is not None: # a TLS transport wraps the TCP transport, and its handle is an SSL connection without a socket
+            handle = getattr(transport, 'getHandle', lambda: None)()
+            if hasattr(handle, 'setsockopt'):
+                for (level, option, value) in self._socketOptions:
+                    handle.setsockopt(level, option, value)
+                return
+            transport = getattr(transport, 'transport', None)
+        self.log.warning('Could not set socket options: no socket found for %s' % self.transport)
+
+    def _streamed(self, _, reader):
+        if reader.remaining:
+            self._abort(reader.error or 'file ended %d bytes before the end of the body' % reader.remaining)
+            return
+        buffers, self._pending = self._pending, None
+        self._write(buffers)
+
+    def _streamFailed(self, failure):
+        self._abort(failure.getErrorMessage())
+
+    def _write(self, buffers):
+        if self._pending is not None: # keep the order of the frames
+            self._pending.extend(buffers)
+            return
+        for (index, data) in enumerate(buffers):
+            if isinstance(data, StompFileBody): # stream the body, and queue everything after it until it is done
+                self.transport.writeSequence(binaryBuffers(buffers[:index]))
+                self._pending = buffers[index + 1:]
+                reader = _FileBodyReader(data)
+                FileSender().beginFileTransfer(reader, self.transport).addCallbacks(self._streamed, self._streamFailed, callbackArgs=(reader,))
+                return
+        self.transport.writeSequence(binaryBuffers(buffers)) # in Python 2, Twisted joins the buffers with str.join()
+
+class _FileBodyReader(object):
+    """A file-like view of a :class:`~.StompFileBody` for a :class:`~twisted.protocols.basic.FileSender`, which stops after the size of the body even if the file is larger."""
+    def __init__(self, body):
+        self.remaining = body.size
+        self.error = None
+        self._body = body
+
+    def read(self, size):
+        position = self._body.size - self.remaining
+        try:
+            data = self._body[position:position + min(size, self.remaining)]
+        except IOError as e: # end the transfer, and let the protocol report the error
+            self.error = str(e)
+            return b''
+        self.remaining -= len(data)
+        return data
+
 class StompFactory(Factory):
     protocol = StompProtocol
 
@@ -9,7 +9,7 @@ from stompest.async import Stomp
 from stompest.async.listener import SubscriptionListener
 from stompest.config import StompConfig
 from stompest.error import StompCancelledError, StompConnectionError, StompProtocolError
-from stompest.protocol import StompSpec
+from stompest.protocol import StompBodyStream, StompSpec
 
 from .broker_simulator import BlackHoleStompServer, ErrorOnConnectStompServer, ErrorOnSendStompServer, RemoteControlViaFrameStompServer
 
@@ -271,6 +271,76 @@ class AsyncClientDisconnectTimeoutTestCase(AsyncClientBaseTestCase):
         self._got_message.callback(None)
         yield self.wait
 
+class RecordingStompServer(RemoteControlViaFrameStompServer):
+    sent = []
+
+    def handleSend(self, frame):
+        self.sent.append(frame)
+        RemoteControlViaFrameStompServer.handleSend(self, frame)
+
+class AsyncClientSendManyTestCase(AsyncClientBaseTestCase):
+    protocols = [RecordingStompServer]
+
+    @defer.inlineCallbacks
+    def test_sendMany(self):
+        port = self.connections[0].getHost().port
+        config = StompConfig(uri='tcp://localhost:%d' % port)
+        client = Stomp(config)
+        yield client.connect()
+
+        bodies = [b'one', b'', b'three']
+        del RecordingStompServer.sent[:]
+        yield client.sendMany('/queue/bla', bodies, {'foo': 'bar'})
+        client.send('/queue/fake', b'shutdown')
+        try:
+            yield client.disconnected
+        except StompConnectionError:
+            pass
+        else:
+            raise Exception('Unexpected clean disconnect.')
+
+        self.assertEquals([frame.body for frame in RecordingStompServer.sent], bodies + [b'shutdown'])
+        for frame in RecordingStompServer.sent[:3]:
+            self.assertEquals(frame.headers[StompSpec.DESTINATION_HEADER], '/queue/bla')
+            self.assertEquals(frame.headers['foo'], 'bar')
+
+class AsyncClientStreamTestCase(AsyncClientBaseTestCase):
+    protocols = [RemoteControlViaFrameStompServer]
+
+    @defer.inlineCallbacks
+    def test_subscribe_stream(self):
+        port = self.connections[0].getHost().port
+        config = StompConfig(uri='tcp://localhost:%d' % port)
+        client = Stomp(config)
+        yield client.connect()
+
+        chunks = []
+        class Stream(StompBodyStream):
+            def received(self, chunk):
+                chunks.append(chunk.tobytes())
+
+        self._got_message = defer.Deferred()
+        yield client.subscribe('/queue/bla', listener=SubscriptionListener(self._on_message), stream=Stream)
+        body = yield self._got_message
+        self.assertEquals(body, b'') # the body has been streamed
+        self.assertEquals(b''.join(chunks), b'hi')
+
+        yield client.disconnect()
+        yield client.disconnected # the subscriptions are flushed, and so are their streams
+
+        yield client.connect()
+        self._got_message = defer.Deferred()
+        yield client.subscribe('/queue/bla', listener=SubscriptionListener(self._on_message))
+        body = yield self._got_message
+        self.assertEquals(body, b'hi')
+        self.assertEquals(b''.join(chunks), b'hi')
+
+        yield client.disconnect()
+        yield client.disconnected
+
+    def _on_message(self, client, msg):
+        self._got_message.callback(msg.body)
+
 if __name__ == '__main__':
     import sys
     from twisted.scripts import trial
@@ -0,0 +1,90 @@
+import array
+import logging
+import tempfile
+
+from twisted.python import log
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+from stompest._backwards import binaryType
+from stompest.async.protocol import StompProtocol
+from stompest.protocol import commands, StompFileBody
+
+from stompest.tests import mock
+
+observer = log.PythonLoggingObserver()
+observer.start()
+logging.basicConfig(level=logging.DEBUG)
+
+class StompProtocolFileBodyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.TemporaryFile()
+        self.file.write(b'0123456789 and more')
+        self.file.seek(0)
+        self.protocol = StompProtocol(mock.Mock(), mock.Mock())
+        self.transport = proto_helpers.StringTransport()
+        self.transport.abortConnection = mock.Mock()
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        self.file.close()
+
+    def _produce(self):
+        while self.transport.producer is not None:
+            self.transport.producer.resumeProducing()
+
+    def test_file_body_stops_after_its_size(self):
+        frames = [commands.send('/queue/test', StompFileBody(self.file, 10)), commands.send('/queue/test', b'next')]
+        self.protocol.sendMany(frames)
+        head = binaryType(frames[0]).split(b'0123456789')[0]
+        self.assertEqual(head, self.transport.value()) # the second frame waits for the file body
+        self._produce()
+        self.assertEqual(binaryType(frames[0]) + binaryType(frames[1]), self.transport.value())
+        self.assertEqual(0, self.file.tell())
+        self.assertEqual(0, self.transport.abortConnection.call_count)
+
+    def test_short_file_body_drops_connection(self):
+        frames = [commands.send('/queue/test', StompFileBody(self.file, 100)), commands.send('/queue/test', b'next')]
+        self.protocol.sendMany(frames)
+        self._produce()
+        self.assertEqual(1, self.transport.abortConnection.call_count)
+        self.assertFalse(self.transport.value().endswith(binaryType(frames[1])))
+        self.assertEqual(None, self.protocol._pending)
+
+    def test_buffer_bodies(self):
+        frames = [commands.send('/queue/test', array.array('B', b'array')), commands.send('/queue/test', memoryview(b'view')), commands.send('/queue/test', bytearray(b'bytes'))]
+        self.protocol.sendMany(frames)
+        self.assertEqual(b''.join(binaryType(frame) for frame in frames), self.transport.value())
+        self.transport.clear()
+        frames = [commands.send('/queue/test', StompFileBody(self.file, 10)), commands.send('/queue/test', array.array('B', b'after'))]
+        self.protocol.sendMany(frames)
+        self._produce()
+        self.assertEqual(b''.join(binaryType(frame) for frame in frames), self.transport.value())
+
+class StompProtocolSocketOptionsTestCase(unittest.TestCase):
+    socketOptions = [(6, 1, 1), (1, 9, 1)] # TCP_NODELAY, SO_KEEPALIVE
+
+    def _connect(self, transport):
+        protocol = StompProtocol(mock.Mock(), mock.Mock(), socketOptions=self.socketOptions)
+        protocol.makeConnection(transport)
+        return protocol
+
+    def test_socket_options(self):
+        transport = proto_helpers.StringTransport()
+        transport.getHandle = mock.Mock()
+        self._connect(transport)
+        self.assertEqual([mock.call(*option) for option in self.socketOptions], transport.getHandle.return_value.setsockopt.call_args_list)
+
+    def test_socket_options_tls(self):
+        tcp = proto_helpers.StringTransport()
+        tcp.getHandle = mock.Mock()
+        tls = proto_helpers.StringTransport() # like a TLSMemoryBIOProtocol which wraps the TCP transport
+        tls.getHandle = mock.Mock(return_value=object()) # an SSL connection without a socket
+        tls.transport = tcp
+        self._connect(tls)
+        self.assertEqual([mock.call(*option) for option in self.socketOptions], tcp.getHandle.return_value.setsockopt.call_args_list)
+
+    def test_socket_options_without_socket(self):
+        transport = proto_helpers.StringTransport()
+        transport.getHandle = mock.Mock(return_value=object())
+        self._connect(transport) # does not fail
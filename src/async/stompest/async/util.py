@@ -5,9 +5,7 @@ from twisted.internet import defer, reactor
 from twisted.internet.endpoints import clientFromString
 
 from stompest.error import StompAlreadyRunningError, StompNotRunningError
-from stompest.util import cloneFrame
-
-MESSAGE_FAILED_HEADER = 'message-failed'
+from stompest.util import cloneFrame, MESSAGE_FAILED_HEADER
 
 class InFlightOperations(collections.MutableMapping):
     def __init__(self, info):
@@ -1,10 +1,32 @@
 import sys
 
+try:
+    from collections.abc import Mapping # @UnusedImport
+except ImportError:
+    from collections import Mapping # @UnusedImport @Reimport
+
 _PY2 = sys.version_info[0] == 2
 
 def makeBytesFromSequence(sequence):
     return binaryType(b''.join(sequence) if _PY2 else sequence)
 
+def memoryView(data):
+    try:
+        return memoryview(data)
+    except TypeError:
+        if not _PY2:
+            raise
+        return memoryview(buffer(data)) # @UndefinedVariable # objects with the old buffer interface only (e.g., array.array or mmap.mmap)
+
+def binaryBuffers(buffers):
+    return [(data if isinstance(data, str) else memoryView(data).tobytes()) for data in buffers] if _PY2 else buffers # in Python 2, str.join() accepts only strings
+
+def joinBuffers(buffers):
+    return b''.join(binaryBuffers(buffers))
+
+def readOnly(view):
+    return view.toreadonly() if hasattr(view, 'toreadonly') else view # memoryview.toreadonly() is new in Python 3.8
+
 def nextMethod(iterator):
     return getattr(iterator, 'next' if _PY2 else '__next__')
 
@@ -8,6 +8,13 @@ class StompConfig(object):
     :param check: Decides whether the :class:`~.StompSession` object which is used to represent the STOMP sesion should be strict about the session's state: (e.g., whether to allow calling the session's :meth:`~.StompSession.send` when disconnected).
     :param sslContext: An SSL context to wrap around a TCP socket connection. This object is defined in the Python standard library: `ssl.SSLContext <https://docs.python.org/3/library/ssl.html#ssl.SSLContext>`_
     :type sslContext: ssl.SSLContext
+    :param lazyHeaders: Decides whether the headers of received frames are decoded only when they are accessed (cf. the **lazyHeaders** parameter of :class:`~.StompParser`).
+    :param zeroCopy: Decides whether the bodies of received frames are read-only :class:`memoryview` objects into the receive buffer instead of copies (cf. the **zeroCopy** parameter of :class:`~.StompParser`). This saves copying large bodies, but small bodies take more memory this way.
+    :param spoolSize: If not :obj:`None`, the bodies of received frames of at least this many bytes (according to their **content-length** header) are written to a file as they arrive instead of being held in memory (cf. the **spoolSize** parameter of :class:`~.StompParser`).
+    :param spool: A callable which returns the file a large body is spooled to (cf. the **spool** parameter of :class:`~.StompParser`). The default is :obj:`None`, which means an anonymous temporary file per frame.
+    :param writeBufferSize: If not :obj:`None`, the sync client buffers outgoing frames and writes them at once when they add up to at least this many bytes, when you call :meth:`~.sync.client.Stomp.flush`, before waiting for incoming frames, and upon disconnect. Bodies which are not immutable bytes (e.g., a :class:`bytearray` or a :class:`memoryview`) are copied into the buffer, so you may reuse them as soon as a frame has been sent. A :class:`~.StompFileBody` is not copied, though: its file must not change until the frame is flushed. The default is :obj:`None`, which means that each frame is written right away. The async client leaves buffering to Twisted and ignores this option.
+    :param maxReadSize: The sync client starts with receiving up to :attr:`~.sync.transport.StompFrameTransport.READ_SIZE` bytes at a time and doubles this amount while the receives fill it completely, up to this cap (shrinking it again when the traffic slows down). The default is :obj:`None`, which means :attr:`~.sync.transport.StompFrameTransport.MAX_READ_SIZE`. The async client ignores this option.
+    :param socketOptions: A list of socket options which both clients apply to the TCP socket of each broker connection. Each option is a tuple (**level**, **option**, **value**) as it is accepted by `socket.setsockopt <https://docs.python.org/3/library/socket.html#socket.socket.setsockopt>`_. The sync client sets these options before it connects, the async client as soon as the connection is made. The default is :obj:`None`, which means that the operating system defaults apply.
 
     .. note :: Login and passcode have to be the same for all brokers because they are not part of the failover URI scheme.
 
@@ -37,11 +44,35 @@ class StompConfig(object):
             sslContext=sslContext
         )
 
+    *Socket Options Example*
+
+    .. code-block:: python
+
+        import socket
+        config = StompConfig(
+            'tcp://host.com:61613',
+            socketOptions=[
+                (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), # disable Nagle's algorithm: send small frames right away
+                (socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024), # bigger buffers for large messages over links with a high latency
+                (socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024),
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60), # Linux only
+                (socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, 30000) # Linux only
+            ]
+        )
+
     """
-    def __init__(self, uri, login=None, passcode=None, version=None, check=True, sslContext=None):
+    def __init__(self, uri, login=None, passcode=None, version=None, check=True, sslContext=None, lazyHeaders=False, zeroCopy=False, writeBufferSize=None, maxReadSize=None, socketOptions=None, spoolSize=None, spool=None):
         self.uri = uri
         self.login = login
         self.passcode = passcode
         self.version = version
         self.check = check
         self.sslContext = sslContext
+        self.lazyHeaders = lazyHeaders
+        self.zeroCopy = zeroCopy
+        self.writeBufferSize = writeBufferSize
+        self.maxReadSize = maxReadSize
+        self.socketOptions = socketOptions
+        self.spoolSize = spoolSize
+        self.spool = spool
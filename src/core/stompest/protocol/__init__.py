@@ -3,7 +3,8 @@
 .. note:: Please restrict your imports to the main package :mod:`stompest.protocol`. The subpackage structure is potentially unstable.
 """
 from stompest.protocol.failover import StompFailoverTransport, StompFailoverUri
-from stompest.protocol.frame import StompFrame
-from stompest.protocol.parser import StompParser
+from stompest.protocol.frame import StompFileBody, StompFrame
+from stompest.protocol.parser import StompBodyStream, StompParser
 from stompest.protocol.spec import StompSpec
 from stompest.protocol.session import StompSession
+from stompest.protocol.template import StompSendTemplate
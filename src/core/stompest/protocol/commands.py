@@ -30,10 +30,11 @@ StompFrame(command='DISCONNECT', headers={'receipt': 'message-12345'})
 """
 
 from stompest.error import StompProtocolError
-from stompest._backwards import textType
+from stompest._backwards import binaryType, textType
 
-from stompest.protocol.frame import StompFrame, StompHeartBeat
+from stompest.protocol.frame import StompFileBody, StompFrame, StompHeartBeat, _bodySize
 from stompest.protocol.spec import StompSpec
+from stompest.protocol.template import StompSendTemplate
 
 # outgoing frames
 
@@ -93,11 +94,18 @@ def disconnect(receipt=None, version=None):
 def send(destination, body=b'', headers=None, receipt=None, version=None):
     """Create a **SEND** frame.
     
-    :param destination: Destination for the frame.
-    :param body: Binary message body. If the body contains null-bytes, it must be accompanied by the STOMP header **content-length** which specifies the number of bytes in the message body.
+    :param destination: Destination for the frame, or a :class:`~.StompSendTemplate` which pre-renders the destination and the headers common to many frames.
+    :param body: Binary message body. If the body contains null-bytes, it must be accompanied by the STOMP header **content-length** which specifies the number of bytes in the message body. Instead of a binary string, you may pass a file object (which is wrapped into a :class:`~.frame.StompFileBody`), an :class:`mmap.mmap`, or any other object supporting the buffer protocol. Such a body is written to the wire without being copied, and the **content-length** header is added unless you specify it yourself.
     :param headers: Additional STOMP headers.
     :param receipt: See :func:`disconnect`.
     """
+    if _isFile(body):
+        body = StompFileBody(body)
+    if not isinstance(body, binaryType):
+        headers = dict(headers or [])
+        headers.setdefault(StompSpec.CONTENT_LENGTH_HEADER, textType(_bodySize(body)))
+    if isinstance(destination, StompSendTemplate):
+        return destination.frame(body, headers, receipt, version=version)
     frame = StompFrame(StompSpec.SEND, dict(headers or []), body, version=version)
     frame.headers[StompSpec.DESTINATION_HEADER] = destination
     _addReceiptHeader(frame, receipt)
@@ -295,14 +303,22 @@ def _ackHeaders(frame, transactions):
     else:
         _checkHeader(frame, StompSpec.ACK_HEADER)
         keys = {StompSpec.ACK_HEADER: StompSpec.ID_HEADER}
+    headers = frame.headers
     try:
-        transaction = frame.headers[StompSpec.TRANSACTION_HEADER]
+        transaction = headers[StompSpec.TRANSACTION_HEADER]
     except KeyError:
         pass
     else:
         if transaction in set(transactions or []):
             keys[StompSpec.TRANSACTION_HEADER] = StompSpec.TRANSACTION_HEADER
-    return {keys[key]: value for (key, value) in frame.headers.items() if key in keys}
+    return {value: headers[key] for (key, value) in keys.items() if key in headers}
+
+def _isFile(body):
+    try:
+        body.fileno()
+    except (AttributeError, IOError, ValueError): # io.UnsupportedOperation (e.g., of an io.BytesIO) is an IOError and a ValueError
+        return False
+    return hasattr(body, 'read')
 
 def _addReceiptHeader(frame, receipt):
     if not receipt:
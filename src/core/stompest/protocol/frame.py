@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
-from stompest._backwards import binaryType, textType
+import functools
+import os
+import sys
+
+from stompest._backwards import binaryType, joinBuffers, textType
+from stompest.error import StompFrameError
 
 from stompest.protocol.spec import StompSpec
-from stompest.protocol.util import escape
+from stompest.protocol.util import byteView, escape, unescape
 
 class StompFrame(object):
     u"""This object represents a STOMP frame.
     
     :param command: A valid STOMP command.
-    :param headers: The STOMP headers (represented as a :class:`dict`), or :obj:`None` (no headers).
-    :param body: The frame body. The body will be cast as a binary string :class:`str` (Python 2) or :class:`bytes` (Python 3).
+    :param headers: The STOMP headers (represented as a :class:`dict`), or :obj:`None` (no headers). The frame keeps its own copy of the headers, which tracks modifications so that the frame's wire-level representation is rendered only once until it changes.
+    :param body: The frame body. The body will be cast as a binary string :class:`str` (Python 2) or :class:`bytes` (Python 3). Any other object supporting the buffer protocol (e.g., a :class:`memoryview` or an :class:`mmap.mmap`) is accepted, too, and so is a :class:`StompFileBody`. Such bodies are written to the wire without being copied into a :class:`bytes` object.
     :param rawHeaders: The raw STOMP headers (represented as a collection of (header, value) pairs), or :obj:`None` (no raw headers).
     :param version: A valid STOMP protocol version, or :obj:`None` (equivalent to the :attr:`DEFAULT_VERSION` attribute of the :class:`~.StompSpec` class).
         
@@ -50,7 +55,10 @@ class StompFrame(object):
     {'some french': 'fenêtre'}
     
     """
+    __slots__ = ('body', '_cache', '_command', '_headers', '_rawHeaders', '_version')
+
     INFO_LENGTH = 20
+    _CODECS = dict((version, StompSpec.codec(version)) for version in StompSpec.VERSIONS)
     _KEYWORDS_AND_FIELDS = [('headers', '_headers', {}), ('body', 'body', b''), ('rawHeaders', 'rawHeaders', None), ('version', 'version', StompSpec.DEFAULT_VERSION)]
 
     def __init__(self, command, headers=None, body=b'', rawHeaders=None, version=None):
@@ -61,17 +69,27 @@ class StompFrame(object):
         self.rawHeaders = rawHeaders
 
     def __bytes__(self):
-        return b''.join([self._encode(StompSpec.LINE_DELIMITER.join(self._headlines)), self.body, self._encode(StompSpec.FRAME_DELIMITER)])
+        return joinBuffers([(data.tobytes() if isinstance(data, StompFileBody) else data) for data in self.buffers()])
 
     def __eq__(self, other):
-        """Two frames are considered equal if, and only if, they render the same wire-level frame, that is, if their string representation is identical."""
+        """Two frames are considered equal if, and only if, they render the same wire-level frame, that is, if their string representation is identical. Frames with the same command, textual headers, body and version are equal without rendering both of them."""
         try:
-            return binaryType(other) == binaryType(self)
+            if not isinstance(other, StompFrame):
+                return binaryType(other) == binaryType(self)
+            if _bodyContent(self.body) != _bodyContent(other.body):
+                return False
+            if (self.command == other.command) and (self._version == other._version) and _isTextual(self._structure()) and _isTextual(other._structure()) and (self._structure() == other._structure()):
+                self._head() # equal textual structures render alike, if they render at all
+                return True
+            return self._head() == other._head()
         except:
             return False
 
     __hash__ = None
 
+    def __getstate__(self):
+        return dict(self)
+
     def __iter__(self):
         yield ('command', self.command)
         for (keyword, field, default) in self._KEYWORDS_AND_FIELDS:
@@ -85,13 +103,22 @@ class StompFrame(object):
             for (keyword, value) in self
         ))
 
+    def __setstate__(self, state):
+        self.__init__(**state)
+
     def __str__(self):
         return self.__bytes__()
 
+    def buffers(self):
+        """Produce the wire-level frame as a list of buffers: the encoded command and headers, the body, and the frame delimiter. In contrast to :meth:`__bytes__`, the body is not copied, so the frame may be written by scatter-gather I/O."""
+        return [self._head(), self.body, StompSpec.FRAME_DELIMITER.encode(self._CODECS[self._version])]
+
     def info(self):
         """Produce a log-friendly representation of the frame (show only non-trivial content, and truncate the message to INFO_LENGTH characters)."""
         headers = self.headers and 'headers=%s' % self.headers
         body = self.body[:self.INFO_LENGTH]
+        if isinstance(body, memoryview):
+            body = body.tobytes()
         if len(body) < len(self.body):
             body += b'...'
         body = body and ('body=%s' % repr(body))
@@ -100,19 +127,46 @@ class StompFrame(object):
         return '%s frame [%s]' % (self.command, info)
 
     def setContentLength(self):
-        item = (StompSpec.CONTENT_LENGTH_HEADER, textType(len(self.body)))
+        item = (StompSpec.CONTENT_LENGTH_HEADER, textType(_bodySize(self.body)))
         if self.rawHeaders is None:
-            self.headers.update([item])
+            self._headers.update([item])
         else:
             self.rawHeaders.insert(0, item)
 
+    @property
+    def command(self):
+        return self._command
+
+    @command.setter
+    def command(self, value):
+        self._command = value
+        self._cache = None
+
     @property
     def headers(self):
-        return self._headers if (self.rawHeaders is None) else dict(reversed(self.rawHeaders))
+        rawHeaders = self._rawHeaders
+        if rawHeaders is None:
+            return self._headers
+        return rawHeaders.headers
 
     @headers.setter
     def headers(self, value):
-        self._headers = value
+        self._headers = value if isinstance(value, _HeaderDict) else _HeaderDict(value)
+        self._cache = None
+
+    @property
+    def rawHeaders(self):
+        rawHeaders = self._rawHeaders
+        if isinstance(rawHeaders, _HeaderBlock):
+            rawHeaders = self._rawHeaders = rawHeaders.rawHeaders
+        return rawHeaders
+
+    @rawHeaders.setter
+    def rawHeaders(self, value):
+        if not ((value is None) or isinstance(value, (_RawHeaders, _HeaderBlock))):
+            value = _RawHeaders(value)
+        self._rawHeaders = value
+        self._cache = None
 
     @property
     def version(self):
@@ -120,17 +174,46 @@ class StompFrame(object):
 
     @version.setter
     def version(self, value):
-        self._version = version = StompSpec.version(value)
-        codec = StompSpec.codec(version)
-        self._encode = lambda text: text.encode(codec)
+        self._version = StompSpec.version(value)
+        self._cache = None
+
+    @classmethod
+    def _parsed(cls, command, rawHeaders, version):
+        """Create a frame for the parser, which has already checked the **command** and the **version** and passes **rawHeaders** as a :class:`_RawHeaders` list or a :class:`_HeaderBlock`. This spares the per-frame overhead of the property setters."""
+        frame = cls.__new__(cls)
+        frame._command, frame._headers, frame.body, frame._rawHeaders, frame._version, frame._cache = command, _HeaderDict(), b'', rawHeaders, version, None
+        return frame
 
     def unraw(self):
         """If the frame has raw headers, copy their deduplicated version to the :attr:`headers` attribute, and remove the raw headers afterwards."""
-        if self.rawHeaders is None:
+        if self._rawHeaders is None:
             return
-        self.headers = self.headers
+        self.headers = dict(self.headers)
         self.rawHeaders = None
 
+    def _head(self):
+        """The encoded command and headers. They are rendered only once, until the frame is modified."""
+        revision = self._revision()
+        cache = self._cache
+        if (cache is None) or (cache[1] != revision):
+            cache = self._cache = (self._render(), revision)
+        return cache[0]
+
+    def _render(self):
+        return StompSpec.LINE_DELIMITER.join(self._headlines).encode(self._CODECS[self._version])
+
+    def _revision(self):
+        rawHeaders = self._rawHeaders
+        return self._headers.revision if (rawHeaders is None) else rawHeaders.revision
+
+    def _structure(self):
+        rawHeaders = self._rawHeaders
+        if rawHeaders is None:
+            return self._headers
+        if isinstance(rawHeaders, _HeaderBlock): # its deduplicated mapping does not reflect repeated headers
+            return None
+        return (rawHeaders,)
+
     @property
     def _escape(self):
         return escape(self.version, self.command)
@@ -144,6 +227,264 @@ class StompFrame(object):
         yield ''
         yield ''
 
+class _HeaderDict(dict):
+    """A :class:`dict` which counts its modifications, so that cached renderings of a frame's headers can be invalidated. As the deduplicated headers of a :class:`_RawHeaders` list, any modification marks this dict as stale, so that the raw headers it was derived from are not affected and will produce a fresh dict upon next access."""
+    __slots__ = ('revision',)
+
+    def __init__(self, *args, **kwargs):
+        super(_HeaderDict, self).__init__(*args, **kwargs)
+        self.revision = 0
+
+    def _modified(self):
+        self.revision += 1
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+class _RawHeaders(list):
+    """The raw headers of a frame: a list of (header, value) pairs which keeps repeated headers in their wire-level order. Its deduplicated :class:`dict` view (the first occurrence of a header wins) is built once and cached until the list is modified."""
+    __slots__ = ('_headers', 'revision')
+
+    def __init__(self, rawHeaders=()):
+        super(_RawHeaders, self).__init__(rawHeaders)
+        self._headers = None
+        self.revision = 0
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+    @property
+    def headers(self):
+        headers = self._headers
+        if (headers is None) or headers.revision:
+            headers = self._headers = _HeaderDict(reversed(self))
+        return headers
+
+    def _modified(self):
+        self._headers = None
+        self.revision += 1
+
+def _modifying(method):
+    @functools.wraps(method, assigned=('__name__', '__doc__')) # slot wrappers have no __module__ on Python 2
+    def _method(self, *args, **kwargs):
+        self._modified()
+        return method(self, *args, **kwargs)
+    return _method
+
+for _name in ('__delitem__', '__ior__', '__setitem__', 'clear', 'pop', 'popitem', 'setdefault', 'update'):
+    if hasattr(dict, _name):
+        setattr(_HeaderDict, _name, _modifying(getattr(dict, _name)))
+for _name in ('__delitem__', '__delslice__', '__iadd__', '__imul__', '__setitem__', '__setslice__', 'append', 'clear', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort'):
+    if hasattr(list, _name):
+        setattr(_RawHeaders, _name, _modifying(getattr(list, _name)))
+
+class _HeaderBlock(object):
+    """The wire-level header lines of a parsed frame. Its deduplicated :attr:`headers` (a :class:`_LazyHeaderDict`) decode and unescape a header only when it is accessed (if a header is repeated, its first occurrence wins). The complete raw headers are decoded once they are requested via :attr:`rawHeaders`."""
+    __slots__ = ('_command', '_data', '_headers', '_rawHeaders', '_version')
+
+    _LINE_DELIMITER = StompSpec.LINE_DELIMITER.encode()
+
+    revision = 0 # the wire-level header lines are immutable
+
+    def __init__(self, data, version, command):
+        self._data = data
+        self._version = version
+        self._command = command
+        self._headers = None
+        self._rawHeaders = None
+
+    @property
+    def headers(self):
+        headers = self._headers
+        if (headers is None) or headers.revision:
+            headers = self._headers = _LazyHeaderDict(self)
+        return headers
+
+    @property
+    def rawHeaders(self):
+        if self._rawHeaders is None:
+            self._rawHeaders = self._parse()
+        return self._rawHeaders
+
+    def _first(self):
+        end = self._data.find(self._LINE_DELIMITER, 1)
+        if end <= 1: # no header lines
+            return
+        name, value = self._data[1:end].decode(StompSpec.codec(self._version)).split(StompSpec.HEADER_SEPARATOR, 1)
+        return unescape(self._version, self._command)(name), self._unescape(value)
+
+    def _find(self, header):
+        codec = StompSpec.codec(self._version)
+        try:
+            key = (StompSpec.LINE_DELIMITER + escape(self._version, self._command)(header) + StompSpec.HEADER_SEPARATOR).encode(codec)
+        except (StompFrameError, TypeError, UnicodeError):
+            raise KeyError(header)
+        start = self._data.find(key)
+        if start == -1:
+            raise KeyError(header)
+        start += len(key)
+        return self._unescape(self._data[start:self._data.find(self._LINE_DELIMITER, start)].decode(codec))
+
+    def _parse(self):
+        rawHeaders = _RawHeaders()
+        for line in self._data.decode(StompSpec.codec(self._version)).split(StompSpec.LINE_DELIMITER)[1:-2]:
+            try:
+                name, value = line.split(StompSpec.HEADER_SEPARATOR, 1)
+            except ValueError:
+                raise StompFrameError('No separator in header line: %r' % line)
+            rawHeaders.append((unescape(self._version, self._command)(name), self._unescape(value)))
+        return rawHeaders
+
+    def _unescape(self, value):
+        stripLineDelimiter = StompSpec.STRIP_LINE_DELIMITER.get(self._version, '')
+        if stripLineDelimiter and (value[-1:] == stripLineDelimiter):
+            value = value[:-1]
+        return unescape(self._version, self._command)(value)
+
+class _LazyHeaderDict(_HeaderDict):
+    """The deduplicated headers of a :class:`_HeaderBlock`. A header is decoded when it is looked up, and all of them are decoded as soon as the dict is iterated over, copied, compared, or modified. As any :class:`_HeaderDict` derived from raw headers, this dict is stale once it is modified."""
+    __slots__ = ('_block',)
+
+    def __init__(self, block):
+        super(_LazyHeaderDict, self).__init__()
+        self._block = block
+        if sys.version_info[0] == 2: # dict() and json copy a dict subclass without calling its methods
+            self._complete()
+            return
+        try: # json takes an empty dict for granted without calling its methods
+            first = block._first()
+        except (StompFrameError, ValueError, UnicodeError): # a malformed header is reported only when it is accessed
+            return
+        if first:
+            dict.__setitem__(self, *first)
+
+    def __contains__(self, header):
+        try:
+            self[header]
+        except KeyError:
+            return False
+        return True
+
+    def __eq__(self, other):
+        self._complete()
+        if isinstance(other, _LazyHeaderDict):
+            other._complete()
+        return dict.__eq__(self, other)
+
+    def __getitem__(self, header):
+        try:
+            return dict.__getitem__(self, header)
+        except KeyError:
+            if self._block is None:
+                raise
+        value = self._block._find(header)
+        dict.__setitem__(self, header, value)
+        return value
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if (equal is NotImplemented) else not equal
+
+    def __reduce__(self):
+        return (_HeaderDict, (dict(self),))
+
+    def get(self, header, default=None):
+        try:
+            return self[header]
+        except KeyError:
+            return default
+
+    def _complete(self):
+        block = self._block
+        if block is None:
+            return
+        dict.update(self, reversed(block.rawHeaders))
+        self._block = None
+
+    def _modified(self):
+        self._complete()
+        super(_LazyHeaderDict, self)._modified()
+
+def _completing(method):
+    @functools.wraps(method, assigned=('__name__', '__doc__')) # slot wrappers have no __module__ on Python 2
+    def _method(self, *args, **kwargs):
+        self._complete()
+        return method(self, *args, **kwargs)
+    return _method
+
+for _name in ('__iter__', '__len__', '__repr__', '__reversed__', 'copy', 'items', 'iteritems', 'iterkeys', 'itervalues', 'keys', 'values', 'viewitems', 'viewkeys', 'viewvalues'):
+    if hasattr(dict, _name):
+        setattr(_LazyHeaderDict, _name, _completing(getattr(dict, _name)))
+
+def _isTextual(structure):
+    """Whether all header names and values of a frame's :meth:`_structure` are strings, so that equal structures render the same (e.g., the values 1 and True are equal, but they do not)."""
+    if structure is None:
+        return False
+    items = structure.items() if isinstance(structure, dict) else structure[0]
+    return all(isinstance(field, _TEXT_TYPES) for item in items for field in item)
+
+_TEXT_TYPES = (binaryType, textType)
+
+def _bodyContent(body):
+    if isinstance(body, binaryType):
+        return body
+    if isinstance(body, StompFileBody):
+        return body.tobytes()
+    return byteView(body)
+
+def _bodySize(body):
+    return len(body) if isinstance(body, (binaryType, StompFileBody)) else len(byteView(body))
+
+class StompFileBody(object):
+    """A frame body which is streamed from a file when the frame is sent (with :func:`os.sendfile`, where possible), so that it is never read into memory as a whole. The body is the remaining content of the file, starting at its current position. Its length is determined right away, so the file should not change until the frame is sent.
+
+    :param file: A file object opened in binary mode which has a file descriptor (a :meth:`fileno`).
+    :param size: The length of the body (in bytes), or :obj:`None` (the remaining size of the file). If you pass a size, the file does not need a file descriptor.
+
+    .. note :: You may just pass a file object as the **body** of :func:`~.commands.send` (or of the :meth:`send` methods of both clients) which wraps it into a :class:`StompFileBody` and adds the **content-length** header. A frame with such a body cannot be pickled or copied.
+    """
+    __slots__ = ('file', 'offset', 'size')
+
+    def __init__(self, file, size=None):
+        self.file = file
+        self.offset = file.tell()
+        self.size = max(os.fstat(file.fileno()).st_size - self.offset, 0) if (size is None) else size
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('%s supports only slicing' % self.__class__.__name__)
+        start, stop, _ = item.indices(self.size)
+        return self._read(start, max(stop - start, 0))
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '%s(file=%s)' % (self.__class__.__name__, repr(self.file))
+
+    def tobytes(self):
+        """Read the whole body into memory."""
+        return self._read(0, self.size)
+
+    def _read(self, start, size):
+        position = self.file.tell()
+        try:
+            self.file.seek(self.offset + start)
+            return self.file.read(size)
+        finally:
+            self.file.seek(position)
+
 class StompHeartBeat(object):
     """This object represents a STOMP heart-beat. Its string representation (via :meth:`__str__`) renders the wire-level STOMP heart-beat."""
     __slots__ = ()
@@ -168,5 +509,8 @@ class StompHeartBeat(object):
     def __str__(self):
         return self.__bytes__()
 
+    def buffers(self):
+        return [self.__bytes__()]
+
     def info(self):
         return 'heart-beat'
@@ -1,16 +1,47 @@
 import collections
 import re
+import tempfile
 
+from stompest._backwards import readOnly
 from stompest.error import StompFrameError
 
-from stompest.protocol.frame import StompFrame, StompHeartBeat
+from stompest.protocol.frame import StompFileBody, StompFrame, StompHeartBeat, _HeaderBlock, _RawHeaders
 from stompest.protocol.spec import StompSpec
 from stompest.protocol.util import unescape
 
+class StompBodyStream(object):
+    """The receiver of a frame body which is streamed by a :class:`StompParser` (see its **stream** parameter). Override :meth:`received` and :meth:`completed` to process the body while it arrives, e.g., to hash, decompress, or forward it.
+
+    :param frame: The frame whose body is about to be streamed. Its headers have been parsed, and its body is empty.
+
+    .. note :: An exception raised by :meth:`received` or :meth:`completed` propagates out of the parser which discards all data it has buffered, so the connection cannot be used any more.
+    """
+    def __init__(self, frame):
+        self.frame = frame
+
+    def received(self, chunk):
+        """A chunk of the body has arrived.
+
+        :param chunk: A :class:`memoryview` into the parser's receive buffer (read-only as of Python 3.8). It is only valid during this call: copy it (e.g., via :meth:`memoryview.tobytes`) if you wish to keep it.
+        """
+
+    def completed(self):
+        """The whole body has arrived. The :attr:`frame` is emitted by the parser right afterwards."""
+
 class StompParser(object):
     """This is a parser for a wire-level byte-stream of STOMP frames.
     
     :param version: A valid STOMP protocol version, or :obj:`None` (equivalent to the :attr:`DEFAULT_VERSION` attribute of the :class:`~.StompSpec` class).
+    :param bufferSize: The initial size (in bytes) of the receive buffer, or :obj:`None` (equivalent to the :attr:`BUFFER_SIZE` attribute). The buffer grows on demand. Once it has run empty, a buffer which has grown beyond :attr:`MAX_IDLE_BUFFER_SIZE` (and its initial size) is replaced by a fresh one of the initial size, so that a single large frame does not pin its memory for the lifetime of the parser.
+    :param lazyHeaders: If :obj:`True`, the parser does not decode the headers of a frame but keeps their wire-level representation. A header is decoded and unescaped only when it is accessed via the :attr:`~.StompFrame.headers` of the parsed frame, and all of them are decoded when the frame's :attr:`~.StompFrame.rawHeaders` are requested (or when the frame is rendered). The headers are still a :class:`dict` which you may copy or modify, but iterating over, copying, comparing, or modifying them decodes all of them. Malformed headers will then only be reported upon access. On Python 2, where :func:`dict` and :mod:`json` copy a :class:`dict` without calling its methods, all headers are decoded as soon as the first one is accessed.
+    :param zeroCopy: If :obj:`True`, the body of a parsed frame is not copied out of the receive buffer but represented as a :class:`memoryview` into it (which is read-only as of Python 3.8). A buffer chunk is reused only when no frame body references it any more; otherwise, the parser continues with a fresh chunk.
+    :param spoolSize: If not :obj:`None`, a body with a **content-length** header of at least this many bytes is not accumulated in the receive buffer but written to a file (see **spool**) as the data arrives, so that the memory needed to receive a frame is bounded regardless of the size of its body. The body of such a frame is a :class:`~.frame.StompFileBody` which reads the file lazily. Its :attr:`~.frame.StompFileBody.file` may also be memory-mapped (with :class:`mmap.mmap`), or the frame may be forwarded as it is, in which case the body is streamed from the file.
+    :param spool: A callable :obj:`f(frame)` which accepts a frame whose body is about to be spooled (the frame's headers are already parsed) and returns a binary file object the body is written to, starting at its current position. The file must be readable and seekable, too, if you wish to access the body via the frame. The default :obj:`None` creates an anonymous :func:`tempfile.TemporaryFile` per frame.
+    :param stream: A callable :obj:`f(frame)` which is called as soon as the headers of a frame which may have a body have been parsed. If it returns a :class:`StompBodyStream` (rather than :obj:`None`), the body is handed to this object chunk by chunk while it arrives, and the frame is emitted with an empty body once it is complete. Streaming takes precedence over spooling (see **spoolSize**), and it works for frames without a **content-length** header, too.
+    
+    .. note :: With **zeroCopy**, each frame body keeps its whole buffer chunk alive. Copy the body (e.g., via :meth:`memoryview.tobytes`) if you wish to keep it around longer than the frame is being processed. It pays off for large bodies only: a :class:`memoryview` object is larger than a :class:`bytes` copy of a body of up to about 150 bytes, so many small frames take more memory with **zeroCopy** than without it (see :file:`tests/frame_profile.py`).
+    
+    .. note :: Incoming data is written into a reusable buffer which the parser traverses with read and write cursors, so consuming a frame does not move the remaining data. The unread part of the buffer is moved to its front only when this is cheap: when the buffer runs out of space and at least as many bytes have been consumed as are left to read. Otherwise, the buffer grows.
     
     Example:
 
@@ -36,13 +67,22 @@ class StompParser(object):
     
     """
     SENTINEL = None
+    BUFFER_SIZE = 4096
+    MAX_IDLE_BUFFER_SIZE = 1048576
 
-    _LINE_DELIMITER = ord(StompSpec.LINE_DELIMITER.encode())
+    _LINE_DELIMITER = StompSpec.LINE_DELIMITER.encode()
+    _LINE_DELIMITER_ORDINAL = ord(_LINE_DELIMITER) # indexing a bytearray yields an int
     _FRAME_DELIMITER = StompSpec.FRAME_DELIMITER.encode()
 
-    def __init__(self, version=None):
+    def __init__(self, version=None, bufferSize=None, lazyHeaders=False, zeroCopy=False, spoolSize=None, spool=None, stream=None):
         self.version = version
-        self._data = bytearray()
+        self.spoolSize = spoolSize
+        self._bufferSize = bufferSize or self.BUFFER_SIZE
+        self._data = bytearray(self._bufferSize)
+        self._lazyHeaders = lazyHeaders
+        self._zeroCopy = zeroCopy
+        self._spool = spool or (lambda _: tempfile.TemporaryFile())
+        self._stream = stream
         self.reset()
 
     def add(self, data):
@@ -50,7 +90,27 @@ class StompParser(object):
         
         :param data: A byte-stream, i.e., a :class:`str`-like (Python 2) or :class:`bytes`-like (Python 3) object.
         """
-        self._data += data
+        size = len(data)
+        self._reserve(size)
+        self._data[self._end:self._end + size] = data
+        self.bufferUpdated(size)
+
+    def getBuffer(self, sizeHint=-1):
+        """Return a writable buffer for wire-level data to be written into directly (e.g., with :meth:`socket.socket.recv_into`), thus avoiding the intermediate byte-stream which :meth:`add` requires. This is the equivalent of :meth:`asyncio.BufferedProtocol.get_buffer`.
+        
+        :param sizeHint: The recommended minimal size of the buffer. If it is zero or negative, the buffer may be of any non-zero size.
+        
+        .. note :: The buffer is a :class:`memoryview` into the parser's receive buffer. After writing into it, you have to call :meth:`bufferUpdated`. Do not use it afterwards.
+        """
+        self._reserve(max(sizeHint, 1))
+        return memoryview(self._data)[self._end:]
+
+    def bufferUpdated(self, nbytes):
+        """Notify the parser that data was written into the buffer obtained by :meth:`getBuffer`. This is the equivalent of :meth:`asyncio.BufferedProtocol.buffer_updated`.
+        
+        :param nbytes: The number of bytes written into the buffer.
+        """
+        self._end += nbytes
         while self._parse():
             pass
 
@@ -76,35 +136,62 @@ class StompParser(object):
         self._frames.append(self._frame)
         self._next()
 
+    def _compact(self, capacity):
+        offset, unread = self._start, self._end - self._start
+        data = self._data if ((capacity == len(self._data)) and not self._shared()) else bytearray(capacity)
+        data[:unread] = self._data[offset:self._end]
+        self._data = data
+        self._start, self._seek, self._end = 0, self._seek - offset, unread
+        if self._eof is not None:
+            self._eof -= offset
+
     def _flush(self):
-        self._truncate(len(self._data))
+        self._end = 0
+        self._truncate(0)
         self._next()
 
     def _next(self):
-        self._frame = self._eof = None
+        self._frame = self._eof = self._spooled = self._streamed = self._sink = self._remaining = None
+
+    def _notify(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            self._flush() # the rest of the frame cannot be parsed any more
+            raise
 
     def _parse(self):
-        if len(self._data) <= self._seek:
+        if self._end <= self._seek:
             return
 
         if self._frame is None:
             return self._parseHeartBeat() or self._parseHead()
 
+        if (self._sink is not None) and (self._eof is None):
+            return self._parseChunk()
+
         return self._parseEndOfFrame() and self._parseBody()
 
     def _parseBody(self):
-        self._frame.body = memoryview(self._data)[self._start:self._eof].tobytes()
+        if self._spooled is not None:
+            self._spooled.file.flush()
+            self._frame.body = self._spooled
+        elif self._streamed is None:
+            body = memoryview(self._data)[self._start:self._eof]
+            self._frame.body = readOnly(body) if self._zeroCopy else body.tobytes()
         if self._frame.body and (self._frame.command not in self._commandsBodyAllowed):
             self._raise('No body allowed for this command (version %s): %r' % (self.version, self._frame.command))
         self._truncate(self._eof + 1)
+        if self._streamed is not None:
+            self._notify(self._streamed.completed)
         self._append()
         return True
 
     def _parseEndOfFrame(self):
         if self._eof is None:
-            eof = self._data.find(self._FRAME_DELIMITER, self._seek)
+            eof = self._data.find(self._FRAME_DELIMITER, self._seek, self._end)
             if eof == -1:
-                self._seek = len(self._data)
+                self._seek = self._end
                 return
             self._eof = eof
         eof = self._data[self._eof:self._eof + 1]
@@ -114,19 +201,48 @@ class StompParser(object):
 
     def _parseHead(self):
         try:
-            endOfHead = self._findHead(self._data, self._start).end()
+            endOfHead = self._findHead(self._data, self._start, self._end).end()
         except AttributeError:
             return
+        if self._lazyHeaders:
+            endOfCommand = self._data.find(self._LINE_DELIMITER, self._start, endOfHead)
+            command = self._parseCommand(self._data[self._start:endOfCommand].decode(self._codec))
+            rawHeaders = _HeaderBlock(memoryview(self._data)[endOfCommand:endOfHead].tobytes(), self.version, command)
+        else:
+            command, rawHeaders = self._parseHeaders(endOfHead)
+        self._frame = StompFrame._parsed(command, rawHeaders, self._version)
+        self._start = endOfHead
+        try:
+            contentLength = int(self._frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+        except KeyError:
+            contentLength = None
+        bodyAllowed = command in self._commandsBodyAllowed
+        self._streamed = self._stream(self._frame) if (self._stream and bodyAllowed) else None
+        if self._streamed is not None:
+            self._sink, self._remaining = self._streamed.received, contentLength
+        elif (contentLength is not None) and self.spoolSize and (contentLength >= self.spoolSize) and bodyAllowed:
+            self._spooled = StompFileBody(self._spool(self._frame), contentLength)
+            self._sink, self._remaining = self._spooled.file.write, contentLength
+        elif contentLength is not None:
+            self._eof = self._seek = self._start + contentLength
+        return True
+
+    def _parseCommand(self, line):
+        if line[-1:] == self._stripLineDelimiter:
+            line = line[:-1]
+        if line not in self._commands:
+            self._raise('Invalid command (version %s): %r' % (self.version, line))
+        return line
+
+    def _parseHeaders(self, endOfHead):
         command, rawHeaders = None, []
         for line in self._data[self._start:endOfHead].decode(self._codec).split(StompSpec.LINE_DELIMITER):
-            if line[-1:] == self._stripLineDelimiter:
-                line = line[:-1]
             if command is None:
-                command = line
-                if command not in self._commands:
-                    self._raise('Invalid command (version %s): %r' % (self.version, command))
+                command = self._parseCommand(line)
                 _unescape = unescape(self.version, command)
                 continue
+            if line[-1:] == self._stripLineDelimiter:
+                line = line[:-1]
             if not line:
                 break
             try:
@@ -134,16 +250,10 @@ class StompParser(object):
             except ValueError:
                 self._raise('No separator in header line: %r' % line)
             rawHeaders.append((_unescape(name), _unescape(value)))
-        self._frame = StompFrame(command=command, rawHeaders=rawHeaders, version=self.version)
-        self._start = endOfHead
-        try:
-            self._eof = self._seek = self._start + int(self._frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
-        except KeyError:
-            pass
-        return True
+        return command, _RawHeaders(rawHeaders)
 
     def _parseHeartBeat(self):
-        if self._data[self._start] != self._LINE_DELIMITER:
+        if self._data[self._start] != self._LINE_DELIMITER_ORDINAL:
             return
         self._seek = self._start = self._start + 1
         if self._heartbeat is not None:
@@ -151,13 +261,53 @@ class StompParser(object):
             self._append()
         return True
 
+    def _parseChunk(self):
+        start = self._start
+        if self._remaining is None: # without a content-length header, the body ends with the next frame delimiter
+            end = self._data.find(self._FRAME_DELIMITER, start, self._end)
+            complete = end != -1
+            if not complete:
+                end = self._end
+        else:
+            end = min(start + self._remaining, self._end)
+            self._remaining -= end - start
+            complete = not self._remaining
+        if end > start:
+            self._notify(self._sink, readOnly(memoryview(self._data)[start:end]))
+        self._truncate(end) # the buffer is empty now (and rewound) unless the whole body has arrived
+        if complete:
+            self._eof = self._start
+        return True
+
     def _raise(self, message):
         self._flush()
         raise StompFrameError(message)
 
+    def _reserve(self, size):
+        capacity = len(self._data)
+        if (capacity - self._end) >= size:
+            return
+        unread = self._end - self._start
+        if (unread + size > capacity) or (unread > self._start):
+            capacity = max(2 * capacity, unread + size)
+        self._compact(capacity)
+
+    def _shared(self):
+        if not self._zeroCopy:
+            return False
+        try: # a buffer cannot be resized while there are memoryviews into it
+            self._data.append(0)
+        except BufferError:
+            return True
+        del self._data[-1]
+        return False
+
     def _truncate(self, position):
-        self._data[:position] = b''
-        self._seek = self._start = 0
+        if (position == self._end) and not self._shared(): # buffer is empty: rewind
+            position = self._end = 0
+            if len(self._data) > max(self.MAX_IDLE_BUFFER_SIZE, self._bufferSize): # release the memory of a large frame
+                self._data = bytearray(self._bufferSize)
+        self._seek = self._start = position
 
     @property
     def version(self):
@@ -117,6 +117,17 @@ class StompSession(object):
         self._receipt(receipt)
         return frame
 
+    def sendMany(self, destination, bodies=None, headers=None):
+        """Create a list of **SEND** frames. The session state is checked only once for the whole batch.
+        
+        :param destination: The destination (or :class:`~.StompSendTemplate`) of all frames, or, if **bodies** is :obj:`None`, an iterable of (destination, body, headers) triples, one per frame.
+        :param bodies: An iterable of message bodies.
+        :param headers: The headers which are common to all frames.
+        """
+        self.__check('sendMany', [self.CONNECTED])
+        messages = destination if (bodies is None) else [(destination, body, headers) for body in bodies]
+        return [stompest.protocol.commands.send(destination_, body, headers_, version=self.version) for (destination_, body, headers_) in messages]
+
     def subscribe(self, destination, headers=None, receipt=None, context=None):
         """Create a **SUBSCRIBE** frame and keep track of the subscription assiocated to it. This method returns a token which you have to keep if you wish to match incoming **MESSAGE** frames to this subscription with :meth:`message` or to :meth:`unsubscribe` later.
         
@@ -306,6 +317,11 @@ class StompSession(object):
         for (_, destination, headers, receipt, context) in sorted(subscriptions.values()):
             yield destination, headers, receipt, context
 
+    def subscriptions(self):
+        """Return an iterator over the active subscriptions (in the order in which they were initiated). Each item is a tuple (**token**, **destination**, **headers**, **context**). As opposed to :meth:`replay`, this method leaves the subscriptions untouched."""
+        for (_, destination, headers, _, context), token in sorted((subscription, token) for (token, subscription) in self._subscriptions.items()):
+            yield token, destination, headers, context
+
     def subscription(self, token):
         """For a given subscription token, obtain the corresponding subscription context.
         
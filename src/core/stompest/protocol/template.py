@@ -0,0 +1,123 @@
+import operator
+
+from stompest._backwards import textType
+from stompest.error import StompProtocolError
+
+from stompest.protocol.frame import _HeaderDict, StompFrame
+from stompest.protocol.spec import StompSpec
+from stompest.protocol.util import escape
+
+class StompSendTemplate(object):
+    """A template for **SEND** frames to a fixed destination with a fixed set of headers. The wire-level representation of these headers is rendered only once per STOMP protocol version, so that sending a frame only renders the message body and the per-message headers (e.g., **content-length**, **receipt**, or **correlation-id**). You may pass a template instead of a destination to :func:`~.commands.send`, :meth:`~.StompSession.send`, and to the :meth:`send` methods of both clients.
+
+    :param destination: Destination for the frames.
+    :param headers: Additional STOMP headers which are common to all frames. Per-message headers of the same name take precedence.
+
+    **Example**:
+
+    >>> from stompest.protocol import commands, StompSendTemplate, StompSpec
+    >>> template = StompSendTemplate('/queue/test', {'persistent': 'true'})
+    >>> frame = commands.send(template, b'hello', {'correlation-id': '4711'}, version=StompSpec.VERSION_1_1)
+    >>> bytes(frame)
+    b'SEND\\ncorrelation-id:4711\\ndestination:/queue/test\\npersistent:true\\n\\nhello\\x00'
+    >>> frame.headers == {'correlation-id': '4711', 'destination': '/queue/test', 'persistent': 'true'}
+    True
+
+    """
+    def __init__(self, destination, headers=None):
+        self.destination = destination
+        self._headers = dict(headers or [])
+        self._headers[StompSpec.DESTINATION_HEADER] = destination
+        self._encodedLines = {}
+
+    def __repr__(self):
+        return '%s(destination=%s, headers=%s)' % (self.__class__.__name__, repr(self.destination), repr(self.headers))
+
+    @property
+    def headers(self):
+        """The headers which are common to all frames (including the **destination** header)."""
+        return dict(self._headers)
+
+    def frame(self, body=b'', headers=None, receipt=None, version=None):
+        """Create a **SEND** frame from this template. The parameters are the same as for :func:`~.commands.send`, and **headers** are the per-message headers."""
+        headers = dict(headers or [])
+        if receipt:
+            try:
+                headers[StompSpec.RECEIPT_HEADER] = textType(receipt)
+            except:
+                raise StompProtocolError('Invalid receipt (not a string): %s' % repr(receipt))
+        return _TemplateFrame(self, headers, body, version)
+
+    def _lines(self, version):
+        try:
+            return self._encodedLines[version]
+        except KeyError:
+            pass
+        return self._encodedLines.setdefault(version, _headerLines(self._headers, version))
+
+class _TemplateFrame(StompFrame):
+    """A **SEND** frame whose :attr:`headers` are the union of the per-message headers and the headers of its template. As long as these headers are not modified, only the per-message headers are rendered when the frame is sent, and the wire-level frame is the same as for a :class:`~.StompFrame` with these headers. Once you modify the :attr:`headers` (or assign new ones), the frame is rendered like any other frame. A copy (or a pickled version) of this frame is a plain :class:`~.StompFrame`."""
+    __slots__ = ('_template',)
+
+    _KEYWORDS_AND_FIELDS = [('headers', 'headers', {})] + StompFrame._KEYWORDS_AND_FIELDS[1:]
+
+    def __init__(self, template, headers, body, version):
+        super(_TemplateFrame, self).__init__(StompSpec.SEND, headers, body, version=version)
+        self._template = template
+
+    def __reduce__(self):
+        return (StompFrame, (self.command,), self.__getstate__())
+
+    def _getHeaders(self):
+        if self._rawHeaders is not None:
+            return StompFrame.headers.fget(self)
+        headers = self._headers
+        if (self._template is not None) and not isinstance(headers, _MergedHeaderDict):
+            headers = self._headers = _MergedHeaderDict(self._template._headers, headers)
+            self._cache = None # the merged dict counts its modifications from scratch
+        return headers
+
+    def _setHeaders(self, value):
+        StompFrame.headers.fset(self, value)
+        self._template = None
+
+    headers = property(_getHeaders, _setHeaders)
+
+    def _render(self):
+        headers = self._headers
+        if isinstance(headers, _MergedHeaderDict):
+            headers = headers.own
+        if (self._template is None) or (headers is None) or (self._rawHeaders is not None):
+            return super(_TemplateFrame, self)._render()
+        codec = self._CODECS[self._version]
+        lines = _headerLines(headers, self._version)
+        lines.extend(line for line in self._template._lines(self._version) if line[0] not in headers)
+        lines.sort(key=operator.itemgetter(0)) # merge the two sorted runs
+        head = [(self.command + StompSpec.LINE_DELIMITER).encode(codec)]
+        head.extend(line for (_, line) in lines)
+        head.append(StompSpec.LINE_DELIMITER.encode(codec))
+        return b''.join(head)
+
+    def _structure(self):
+        return self.headers if (self._rawHeaders is None) else super(_TemplateFrame, self)._structure()
+
+class _MergedHeaderDict(_HeaderDict):
+    """The :attr:`headers` of a :class:`_TemplateFrame`: the headers of its template, updated with the per-message headers (:attr:`own`). Upon its first modification, this dict forgets which headers were its own, so that the frame is rendered from scratch."""
+    __slots__ = ('own',)
+
+    def __init__(self, template, own):
+        super(_MergedHeaderDict, self).__init__(template)
+        dict.update(self, own)
+        self.own = own
+
+    def __reduce__(self):
+        return (_HeaderDict, (dict(self),))
+
+    def _modified(self):
+        self.own = None
+        super(_MergedHeaderDict, self)._modified()
+
+def _headerLines(headers, version):
+    escape_ = escape(version, StompSpec.SEND)
+    codec = StompSpec.codec(version)
+    return [(header, ('%s%s' % (':'.join(escape_(textType(field)) for field in (header, value)), StompSpec.LINE_DELIMITER)).encode(codec)) for (header, value) in sorted(headers.items())]
@@ -1,5 +1,6 @@
 import re
 
+from stompest._backwards import memoryView, textType
 from stompest.error import StompFrameError
 from stompest.protocol.spec import StompSpec
 
@@ -15,42 +16,57 @@ class _HeadersTransformer(object):
 
     def __init__(self, version, command):
         self._version = version
-        self._escapedCharacters = StompSpec.ESCAPED_CHARACTERS[version]
+        self._search = None # no special characters: leave all text untouched
         if command in StompSpec.COMMANDS_ESCAPE_EXCLUDED[version]:
-            self._sub = lambda _, text: text
-        else:
-            self._sub = re.compile(self._regex).sub
+            return
+        escapedCharacters = StompSpec.ESCAPED_CHARACTERS[version]
+        if escapedCharacters:
+            self._compile(escapedCharacters)
 
     def __call__(self, text):
         try:
-            return self._sub(self._replace, text)
+            if self._search and self._search(text):
+                return self._transform(text)
+            return text
         except Exception as e:
             raise StompFrameError('No escape sequence defined for this character (version %s): %s [text=%s]' % (self._version, e, repr(text)))
 
-    def _replace(self, match):
-        return self._escapeSequences[match.group(1)]
-
 class _HeadersEscaper(_HeadersTransformer):
     _INSTANCES = {} # each class needs its own instance cache
 
-    @property
-    def _escapeSequences(self):
-        return {escapeSequence: '%s%s' % (self._ESCAPE_CHARACTER, character) for (character, escapeSequence) in self._escapedCharacters.items()}
+    def _compile(self, escapedCharacters):
+        self._escapeSequences = {character: '%s%s' % (self._ESCAPE_CHARACTER, code) for (code, character) in escapedCharacters.items()}
+        self._table = {ord(character): textType(escapeSequence) for (character, escapeSequence) in self._escapeSequences.items()}
+        regex = '[%s]' % re.escape(''.join(escapedCharacters.values()))
+        self._search = re.compile(regex).search
+        self._sub = re.compile(regex).sub
 
-    @property
-    def _regex(self):
-        return '(%s)' % '|'.join(map(re.escape, self._escapeSequences))
+    def _transform(self, text):
+        if isinstance(text, textType):
+            return text.translate(self._table)
+        return self._sub(self._replace, text) # a Python 2 byte string cannot be translated with a mapping
+
+    def _replace(self, match):
+        return self._escapeSequences[match.group(0)]
 
 class _HeadersUnescaper(_HeadersTransformer):
     _INSTANCES = {} # each class needs its own instance cache
 
-    @property
-    def _escapeSequences(self):
-        return {'%s%s' % (self._ESCAPE_CHARACTER, character): escapeSequence for (character, escapeSequence) in self._escapedCharacters.items()}
+    def _compile(self, escapedCharacters):
+        self._escapeSequences = {'%s%s' % (self._ESCAPE_CHARACTER, code): character for (code, character) in escapedCharacters.items()}
+        self._search = re.compile('[%s]' % re.escape(self._ESCAPE_CHARACTER + ''.join(escapedCharacters.values()))).search
+        self._sub = re.compile('(%s)' % '|'.join(['%s.' % re.escape(self._ESCAPE_CHARACTER)] + [re.escape(c) for c in escapedCharacters.values()])).sub
 
-    @property
-    def _regex(self):
-        return '(%s)' % '|'.join(['%s.' % re.escape(self._ESCAPE_CHARACTER)] + [re.escape(c) for c in self._escapedCharacters.values()])
+    def _transform(self, text):
+        return self._sub(self._replace, text)
+
+    def _replace(self, match):
+        return self._escapeSequences[match.group(1)]
 
 escape = _HeadersEscaper.get
 unescape = _HeadersUnescaper.get
+
+def byteView(data):
+    """A :class:`memoryview` of a buffer (e.g., of an :class:`array.array`) whose length and slices count bytes rather than items."""
+    view = memoryView(data)
+    return view if (view.format == 'B') else view.cast('B')
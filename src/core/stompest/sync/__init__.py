@@ -1 +1,2 @@
-from stompest.sync.client import Stomp
\ No newline at end of file
+from stompest.sync.client import Stomp
+from stompest.sync.threaded import HeartBeatThread, ThreadSafeStomp
\ No newline at end of file
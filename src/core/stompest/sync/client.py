@@ -54,7 +54,7 @@ import logging
 import time
 
 from stompest.error import StompConnectionError, StompProtocolError
-from stompest.protocol import StompFailoverTransport, StompFrame, StompSession
+from stompest.protocol import StompFailoverTransport, StompFrame, StompSession, StompSpec
 from stompest.util import checkattr
 
 from stompest.sync.transport import StompFrameTransport
@@ -78,6 +78,7 @@ class Stomp(object):
         self._config = config
         self._session = StompSession(self._config.version, self._config.check)
         self._failover = self._failoverFactory(config.uri)
+        self._streams = {} # subscription token -> body stream factory
         self._transport = None
 
     def connect(self, headers=None, versions=None, host=None, heartBeats=None, connectTimeout=None, connectedTimeout=None):
@@ -114,6 +115,10 @@ class Stomp(object):
             for (broker, connectDelay) in self._failover:
                 transport = self._transportFactory(
                     broker['host'], broker['port'], sslContext=self._config.sslContext,
+                    lazyHeaders=self._config.lazyHeaders, zeroCopy=self._config.zeroCopy,
+                    writeBufferSize=self._config.writeBufferSize, maxReadSize=self._config.maxReadSize,
+                    socketOptions=self._config.socketOptions, spoolSize=self._config.spoolSize, spool=self._config.spool,
+                    stream=self._stream,
                 )
                 if connectDelay:
                     self.log.debug('Delaying connect attempt for %d ms' % int(connectDelay * 1000))
@@ -142,9 +147,11 @@ class Stomp(object):
         self.session.connected(frame)
         self.log.info('Connected to stomp broker [session=%s, version=%s]' % (self.session.id, self.session.version))
         self._transport.setVersion(self.session.version)
-        for (destination, headers, receipt, _) in self.session.replay():
+        streams = [self._streams.get(token) for (token, _, _, _) in self.session.subscriptions()] # in the order of replay
+        self._streams = {}
+        for ((destination, headers, receipt, _), stream) in zip(self.session.replay(), streams):
             self.log.info('Replaying subscription %s' % headers)
-            self.subscribe(destination, headers, receipt)
+            self.subscribe(destination, headers, receipt, stream)
 
     @connected
     def disconnect(self, receipt=None):
@@ -164,18 +171,51 @@ class Stomp(object):
     def send(self, destination, body=b'', headers=None, receipt=None):
         """send(destination, body=b'', headers=None, receipt=None)
         
-        Send a **SEND** frame.
+        Send a **SEND** frame. Instead of a **destination**, you may pass a :class:`~.StompSendTemplate` which pre-renders the destination and the headers common to many frames. A large **body** may be a file object or an :class:`mmap.mmap`, which is streamed to the wire without being read into memory (see :func:`~.commands.send`).
         """
         self.sendFrame(self.session.send(destination, body, headers, receipt))
 
     @connected
-    def subscribe(self, destination, headers=None, receipt=None):
-        """subscribe(destination, headers=None, receipt=None)
+    def sendMany(self, destination, bodies=None, headers=None):
+        """sendMany(destination, bodies=None, headers=None)
+        
+        Send a batch of **SEND** frames, all of which are written to the wire at once. The parameters are the same as for :meth:`~.StompSession.sendMany`.
+        
+        **Example**:
+        
+        >>> client.sendMany('/queue/test', [b'one', b'two'], {'persistent': 'true'})
+        >>> client.sendMany([('/queue/a', b'one', None), ('/queue/b', b'two', {'persistent': 'true'})])
+        
+        """
+        self.sendFrames(self.session.sendMany(destination, bodies, headers))
+
+    @connected
+    def subscribe(self, destination, headers=None, receipt=None, stream=None):
+        """subscribe(destination, headers=None, receipt=None, stream=None)
         
         Send a **SUBSCRIBE** frame to subscribe to a STOMP destination. This method returns a token which you have to keep if you wish to match incoming **MESSAGE** frames to this subscription or to :meth:`~.sync.client.Stomp.unsubscribe` later.
+        
+        :param stream: An optional callable :obj:`f(frame)` (typically a subclass of :class:`~.StompBodyStream`) which is called as soon as the headers of a **MESSAGE** frame for this subscription have been received. The body is handed to the object it returns chunk by chunk while it arrives (cf. the **stream** parameter of :class:`~.StompParser`). The frame itself is received as usual, but with an empty body.
+        
+        **Example**:
+        
+        >>> class Digest(StompBodyStream):
+        ...     def __init__(self, frame):
+        ...         super(Digest, self).__init__(frame)
+        ...         self.digest = hashlib.sha256()
+        ...     def received(self, chunk):
+        ...         self.digest.update(chunk)
+        ...     def completed(self):
+        ...         print(self.digest.hexdigest())
+        ...
+        >>> client.subscribe('/queue/large', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT_INDIVIDUAL}, stream=Digest)
         """
         frame, token = self.session.subscribe(destination, headers, receipt)
         self.sendFrame(frame)
+        if stream:
+            self._streams[token] = stream
+        else: # a previous subscription with the same token may have had a stream
+            self._streams.pop(token, None)
         return token
 
     @connected
@@ -185,6 +225,7 @@ class Stomp(object):
         Send an **UNSUBSCRIBE** frame to terminate an existing subscription.
         """
         self.sendFrame(self.session.unsubscribe(token, receipt))
+        self._streams.pop(token, None)
 
     @connected
     def ack(self, frame, receipt=None):
@@ -298,11 +339,43 @@ class Stomp(object):
         .. note :: If you do not flush the subscriptions, they will be replayed upon this client's next :meth:`~.sync.client.Stomp.connect`!
         """
         self.session.close(flush)
+        if flush:
+            self._streams = {}
         try:
             self.__transport and self.__transport.disconnect()
         finally:
             self._transport = None
 
+    def shutdown(self):
+        """Shut down the wire-level connection with the broker, but leave the cleanup to the thread which uses the client: its current (or next) attempt to receive a frame fails with a :class:`~.StompConnectionError`.
+        
+        .. note :: As opposed to all other methods of the client, this method may be called from any thread. For instance, a :class:`~.sync.threaded.HeartBeatThread` calls it if the broker has stopped heart-beating.
+        """
+        transport = self.__transport
+        transport and transport.shutdown()
+
+    def dataWaiting(self):
+        """Whether data from the broker is waiting to be received. As opposed to :meth:`~.sync.client.Stomp.canRead`, this method neither waits, nor flushes, nor receives anything.
+        
+        .. note :: Like :meth:`~.sync.client.Stomp.shutdown`, this method may be called from any thread. For instance, a :class:`~.sync.threaded.HeartBeatThread` calls it to tell a busy application thread (which has not read the broker's latest heart-beats yet) from a dead broker.
+        """
+        transport = self.__transport
+        return bool(transport) and transport.dataWaiting()
+
+    @connected
+    def check(self):
+        """check()
+        
+        Check whether the wire-level connection is still alive. Sending frames does not probe the connection, so a connection which was closed by the broker is only detected by the next failing send or receive. This method detects it right away: it waits for no time at all, and it fetches an incoming frame if there is one (see :meth:`~.sync.client.Stomp.canRead`).
+        
+        .. note :: If the connection is lost, the client will be closed without flushing the subscriptions of its :attr:`~.sync.client.Stomp.session`, and this method will raise a :class:`~.StompConnectionError`.
+        """
+        try:
+            self.canRead(0)
+        except StompConnectionError:
+            self.close(flush=False)
+            raise
+
     @connected
     def canRead(self, timeout=None):
         """canRead(timeout=None)
@@ -328,6 +401,14 @@ class Stomp(object):
                 self._messages.append(frame)
                 return True
 
+    @connected
+    def flush(self):
+        """flush()
+        
+        Write all buffered frames to the wire. This is only needed if you configured a **writeBufferSize** in the client's :class:`~.StompConfig` object and you want your frames to be sent before the buffer is full and before the client waits for incoming frames.
+        """
+        self._transport.flush()
+
     def sendFrame(self, frame):
         """Send a raw STOMP frame.
         
@@ -340,6 +421,35 @@ class Stomp(object):
         self._transport.send(frame)
         self.session.sent()
 
+    def sendFrames(self, frames):
+        """Send several raw STOMP frames at once.
+        
+        :param frames: A list of STOMP frames (represented as :class:`~.StompFrame` objects).
+        
+        .. note :: The same caveats as for :meth:`~.sync.client.Stomp.sendFrame` apply.
+        """
+        if self.log.isEnabledFor(logging.DEBUG):
+            for frame in frames:
+                self.log.debug('Sending %s' % frame.info())
+        self._transport.sendMany(frames)
+        self.session.sent()
+
+    def writeFrames(self, frames):
+        """Send several raw STOMP frames, and write them to the wire right away, together with all buffered frames (cf. :meth:`~.sync.client.Stomp.flush`).
+        
+        :param frames: A list of STOMP frames (represented as :class:`~.StompFrame` objects).
+        
+        .. note :: Like :meth:`~.sync.client.Stomp.shutdown`, this method may be called from any thread. For instance, the writer thread of a :class:`~.sync.threaded.ThreadSafeStomp` and a :class:`~.sync.threaded.HeartBeatThread` send their frames this way. As opposed to :meth:`~.sync.client.Stomp.sendFrames`, it never closes the client: if the frames cannot be sent, the wire-level connection is shut down, and a :class:`~.StompConnectionError` is raised. Cleaning up is left to the thread which uses the client: its current (or next) attempt to receive a frame fails.
+        """
+        transport = self.__transport
+        if not transport:
+            raise StompConnectionError('Not connected')
+        if self.log.isEnabledFor(logging.DEBUG):
+            for frame in frames:
+                self.log.debug('Sending %s' % frame.info())
+        transport.writeFrames(frames)
+        self.session.sent()
+
     def receiveFrame(self):
         """Fetch the next available frame.
         
@@ -348,22 +458,56 @@ class Stomp(object):
         if self.canRead():
             return self._messages.popleft()
 
+    @connected
+    def receiveFrames(self, maxFrames=None, timeout=None):
+        """receiveFrames(maxFrames=None, timeout=None)
+        
+        Fetch a batch of frames: all frames which have already been received, and if there are none, those which arrive after waiting once for incoming data.
+        
+        :param maxFrames: The maximum number of frames to return. If :obj:`None`, there is no limit.
+        :param timeout: This is the time (in seconds) to wait for a frame to become available if there is none yet. If :obj:`None`, we will wait indefinitely.
+        
+        This method returns a list of frames which is empty if no frame has arrived in time. In contrast to calling :meth:`~.sync.client.Stomp.receiveFrame` repeatedly, the connection is checked and the session's heart-beat bookkeeping is updated only once per batch.
+        """
+        transport = self._transport
+        frames = []
+        if maxFrames == 0:
+            return frames
+        while self._messages and ((maxFrames is None) or (len(frames) < maxFrames)):
+            frames.append(self._messages.popleft())
+        received = self._receiveBuffered(transport, frames, maxFrames)
+        deadline = None if (timeout is None) else (time.time() + timeout)
+        while not frames:
+            timeout = deadline and max(0, deadline - time.time())
+            if not transport.canRead(timeout):
+                break
+            self._received(frames, transport.receive())
+            received = True
+            self._receiveBuffered(transport, frames, maxFrames)
+        if received:
+            self.session.received()
+        return frames
+
     @property
     def session(self):
         """The :class:`~.StompSession` associated to this client.
         """
         return self._session
 
+    @property
+    def stats(self):
+        """The receive statistics (a :class:`~.sync.transport.StompTransportStats` object) of the current connection, or :obj:`None` if we are not connected.
+        """
+        return self.__transport and self.__transport.stats
+
     @property
     def _transport(self):
         transport = self.__transport
         if not transport:
             raise StompConnectionError('Not connected')
-        try:
-            transport.canRead(0)
-        except Exception as e:
+        if not transport.connected: # the connection was lost while sending or receiving
             self.close(flush=False)
-            raise e
+            raise StompConnectionError('Not connected')
         return transport
 
     @_transport.setter
@@ -371,6 +515,31 @@ class Stomp(object):
         self.__transport = transport
         self._messages = collections.deque()
 
+    def _received(self, frames, frame):
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug('Received %s' % frame.info())
+        if isinstance(frame, StompFrame): # not a heart-beat
+            frames.append(frame)
+
+    def _stream(self, frame):
+        if (frame.command != StompSpec.MESSAGE) or not self._streams:
+            return
+        try:
+            stream = self._streams.get(self.session.message(frame))
+        except StompProtocolError: # not a message for an active subscription
+            return
+        return stream and stream(frame)
+
+    def _receiveBuffered(self, transport, frames, maxFrames):
+        received = False
+        while (maxFrames is None) or (len(frames) < maxFrames):
+            frame = transport.receiveBuffered()
+            if frame is None:
+                break
+            self._received(frames, frame)
+            received = True
+        return received
+
     # heart-beating
 
     @connected
@@ -409,6 +578,7 @@ class Stomp(object):
         elapsed: 0.50, last received: 0.50, last sent: 0.25
         """
         self.sendFrame(self.session.beat())
+        self._transport.flush() # a buffered heart-beat would be pointless
 
     @property
     def lastSent(self):
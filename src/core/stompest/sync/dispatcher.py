@@ -0,0 +1,224 @@
+"""Process incoming messages concurrently on a thread pool.
+
+A :class:`StompDispatcher` receives **MESSAGE** frames with a :class:`~.sync.client.Stomp` client and hands them to a handler which runs on a :class:`concurrent.futures.ThreadPoolExecutor`. All calls to the client happen in the thread which runs the dispatcher, so the client need not be thread-safe. The dispatcher takes care of acknowledging the messages in a way which is consistent with the **ack** mode of the subscription: in **client-individual** mode, each message is acked as soon as it has been processed; in **client** mode, where an **ACK** frame acknowledges all messages received before, only the last message of the longest prefix of completely processed messages is acked.
+
+.. note :: On Python 2, this module requires the `futures <https://pypi.python.org/pypi/futures>`_ backport.
+
+**Example**:
+
+>>> def handler(frame):
+...     print(frame.body)
+...
+>>> client = Stomp(CONFIG)
+>>> client.connect()
+>>> client.subscribe('/queue/test', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT})
+>>> dispatcher = StompDispatcher(client, handler, StompSpec.ACK_CLIENT, maxInFlight=8, timeout=30, errorDestination='/queue/test-failed')
+>>> dispatcher.run(timeout=5) # returns after no message has arrived for 5 seconds
+>>> client.disconnect()
+
+If the handler is CPU-bound, a :class:`StompProcessDispatcher` runs it in worker processes instead, so that one broker connection may feed all cores of a machine.
+
+"""
+import collections
+import logging
+import time
+
+from concurrent import futures
+
+from stompest.error import StompCancelledError, StompConnectionError, StompProtocolError
+from stompest.protocol import StompFileBody, StompSpec
+from stompest.util import cloneFrame, MESSAGE_FAILED_HEADER
+
+LOG_CATEGORY = __name__
+
+PREFETCH_HEADERS = ['activemq.prefetchSize', 'prefetch-count'] # ActiveMQ, RabbitMQ
+
+class StompDispatcher(object):
+    """Dispatch the **MESSAGE** frames received by a :class:`~.sync.client.Stomp` client to a handler on a thread pool.
+
+    :param client: A connected :class:`~.sync.client.Stomp` client which has subscribed to the destinations whose messages you wish to process.
+    :param handler: A callable :obj:`f(frame)` which accepts a **MESSAGE** frame (a :class:`~.StompFrame` object). It is called in a worker thread, so it must not use the **client**.
+    :param ack: The **ack** mode of the subscriptions (:attr:`~.StompSpec.ACK_AUTO`, :attr:`~.StompSpec.ACK_CLIENT`, or :attr:`~.StompSpec.ACK_CLIENT_INDIVIDUAL`).
+    :param maxInFlight: The maximum number of messages which are being processed at the same time. No more frames are received while this limit is reached.
+    :param timeout: The time (in seconds) after which a message which is still being processed is considered as failed. If :obj:`None`, there is no limit. Note that the handler is not interrupted: it keeps its worker thread busy until it returns, and until then, it counts against **maxInFlight**.
+    :param errorDestination: If a message was not handled successfully, forward a copy of the offending frame (see :func:`~.util.cloneFrame`) to this destination. Example: ``errorDestination='/queue/back-to-square-one'``
+    :param executor: The :class:`concurrent.futures.Executor` which runs the handler. If :obj:`None`, the dispatcher runs a :class:`~concurrent.futures.ThreadPoolExecutor` with **maxInFlight** worker threads while it is running.
+
+    A failed message is forwarded to the **errorDestination** (if there is one) and then acked like a successful one. If there is no error destination, it is nacked in **client-individual** mode (STOMP 1.1 and later). In **client** mode, and if nacking is not possible, it is acked anyway, so that it does not block the acknowledgment of the messages after it.
+    """
+    MAX_IN_FLIGHT = 16
+    POLL_INTERVAL = 0.05 # the time (in seconds) to wait for incoming frames while messages are being processed
+
+    def __init__(self, client, handler, ack=StompSpec.ACK_CLIENT_INDIVIDUAL, maxInFlight=None, timeout=None, errorDestination=None, executor=None):
+        if not callable(handler):
+            raise ValueError('Handler is not callable: %s' % handler)
+        if ack not in (StompSpec.ACK_AUTO, StompSpec.ACK_CLIENT, StompSpec.ACK_CLIENT_INDIVIDUAL):
+            raise StompProtocolError('Invalid ack mode: %s' % ack)
+        self.log = logging.getLogger(LOG_CATEGORY)
+        self.client = client
+        self.maxInFlight = maxInFlight or self.MAX_IN_FLIGHT
+        self.timeout = timeout
+        self.errorDestination = errorDestination
+        self._handler = handler
+        self._ack = ack
+        self._executor = executor
+        self._inFlight = collections.OrderedDict() # future -> (deadline, message), in the order of dispatch
+        self._expired = set() # futures which timed out, but whose handler still keeps a worker busy
+        self._received = {} # token -> messages in the order of arrival (client mode only)
+        self._stopped = False
+
+    def __len__(self):
+        """The number of messages which are being processed."""
+        return len(self._inFlight)
+
+    def run(self, timeout=None):
+        """Receive frames and dispatch the **MESSAGE** frames to the handler. Once no frame has arrived in time, or :meth:`stop` was called, wait for the messages in flight to be processed and acknowledged.
+
+        :param timeout: This is the time (in seconds) to wait for incoming frames. If :obj:`None`, we will wait indefinitely (or until :meth:`stop` is called).
+
+        .. note :: An incoming **ERROR** frame makes this method raise a :class:`~.StompProtocolError` (after the messages in flight have been processed). **RECEIPT** frames are handed over to the client's :meth:`~.sync.client.Stomp.receipt` method. If this method raises an exception, and the messages in flight cannot be acknowledged because the connection is lost, they are dropped (the broker will redeliver them), and the original exception is raised.
+        """
+        self._stopped = False
+        executor = self._executor or self._createExecutor()
+        completed = False
+        try:
+            idleSince = time.time()
+            while not self._stopped:
+                self._complete(wait=self._busy() >= self.maxInFlight)
+                if self._busy() >= self.maxInFlight:
+                    continue
+                wait = None if (timeout is None) else max(0, idleSince + timeout - time.time())
+                if self._inFlight:
+                    wait = self.POLL_INTERVAL if (wait is None) else min(wait, self.POLL_INTERVAL)
+                if self.client.canRead(wait):
+                    self._dispatch(executor, self.client.receiveFrame())
+                    idleSince = time.time()
+                elif (timeout is not None) and (time.time() >= idleSince + timeout):
+                    break
+            completed = True
+        finally:
+            try:
+                self._drain(completed)
+            finally:
+                self._executor or executor.shutdown(wait=False)
+
+    def stop(self):
+        """Make :meth:`run` return after the messages in flight have been processed. You may call this method from the handler or from any other thread."""
+        self._stopped = True
+
+    def _createExecutor(self):
+        return futures.ThreadPoolExecutor(self.maxInFlight)
+
+    def _busy(self):
+        self._expired = set(future for future in self._expired if not future.done())
+        return len(self._inFlight) + len(self._expired)
+
+    def _drain(self, completed):
+        try:
+            while self._inFlight:
+                self._complete(wait=True)
+        except StompConnectionError as e:
+            self._inFlight.clear()
+            self._received.clear()
+            if completed:
+                raise
+            self.log.error('Could not acknowledge the messages in flight [%s]' % e) # do not hide the exception which stopped the dispatcher
+
+    def _complete(self, wait):
+        if wait and (self._inFlight or self._expired):
+            timeout = None
+            if (self.timeout is not None) and self._inFlight:
+                timeout = max(0, min(deadline for (deadline, _) in self._inFlight.values()) - time.time())
+            futures.wait(list(self._inFlight) + list(self._expired), timeout, return_when=futures.FIRST_COMPLETED)
+        now = time.time()
+        tokens = []
+        for future, (deadline, message) in list(self._inFlight.items()):
+            if future.done():
+                failure = future.exception()
+            elif (deadline is not None) and (now >= deadline):
+                if not future.cancel(): # the handler is running, and its worker is not free before it returns
+                    self._expired.add(future)
+                failure = StompCancelledError('Handler for message did not finish in time [timeout=%s]' % self.timeout)
+            else:
+                continue
+            del self._inFlight[future]
+            self._completed(message, failure)
+            if (self._ack == StompSpec.ACK_CLIENT) and (message[1] not in tokens):
+                tokens.append(message[1])
+        for token in tokens: # one ack per subscription for all messages completed in this pass
+            self._ackPrefix(token)
+
+    def _completed(self, message, failure):
+        frame = message[0]
+        nack = False
+        if failure is not None:
+            self.log.error('Handler failed for message %s [%s]' % (frame.headers.get(StompSpec.MESSAGE_ID_HEADER), failure))
+            if self.errorDestination:
+                errorFrame = cloneFrame(frame, persistent=True)
+                errorFrame.headers.setdefault(MESSAGE_FAILED_HEADER, str(failure))
+                self.client.send(self.errorDestination, errorFrame.body, errorFrame.headers)
+            else:
+                nack = frame.version != StompSpec.VERSION_1_0
+        if self._ack == StompSpec.ACK_CLIENT_INDIVIDUAL:
+            (self.client.nack if nack else self.client.ack)(frame)
+        elif self._ack == StompSpec.ACK_CLIENT:
+            message[2] = True
+
+    def _ackPrefix(self, token):
+        messages = self._received[token]
+        last = None
+        while messages and messages[0][2]:
+            last, _, _ = messages.popleft()
+        if last is not None:
+            self.client.ack(last)
+
+    def _dispatch(self, executor, frame):
+        if frame.command == StompSpec.ERROR:
+            raise StompProtocolError('Received %s' % frame.info())
+        if frame.command == StompSpec.RECEIPT:
+            self.client.receipt(frame)
+            return
+        if frame.command != StompSpec.MESSAGE:
+            self.log.warning('Ignoring unexpected %s' % frame.info())
+            return
+        message = [frame, self.client.message(frame), False] # frame, subscription token, processed
+        if self._ack == StompSpec.ACK_CLIENT:
+            self._received.setdefault(message[1], collections.deque()).append(message)
+        deadline = None if (self.timeout is None) else (time.time() + self.timeout)
+        self._inFlight[self._submit(executor, frame)] = (deadline, message)
+
+    def _submit(self, executor, frame):
+        return executor.submit(self._handler, frame)
+
+class StompProcessDispatcher(StompDispatcher):
+    """A :class:`StompDispatcher` which runs the handler in worker processes. Only the headers and the body of a **MESSAGE** frame are sent to the worker, which is cheaper than pickling the whole frame. The messages are acknowledged in the parent process once the worker is done. The parameters are the same as for :class:`StompDispatcher`, except for the following:
+
+    :param handler: A callable :obj:`f(headers, body)` which accepts the headers (a :obj:`dict`) and the body (a :obj:`bytes` object) of a **MESSAGE** frame. It must be picklable, e.g., a function defined at the top level of a module. If it raises an exception, the message is considered as failed.
+    :param maxInFlight: The maximum number of messages which are being processed (or queued for a worker) at the same time. If :obj:`None`, this is the sum of the prefetch sizes (see :data:`PREFETCH_HEADERS`) of the client's active subscriptions, so that the broker's prefetch window keeps all workers busy.
+    :param executor: If :obj:`None`, the dispatcher runs a :class:`~concurrent.futures.ProcessPoolExecutor` with one worker process per CPU while it is running.
+    """
+    def __init__(self, client, handler, ack=StompSpec.ACK_CLIENT_INDIVIDUAL, maxInFlight=None, timeout=None, errorDestination=None, executor=None):
+        if maxInFlight is None:
+            maxInFlight = sum(prefetchSize(headers) for (_, _, headers, _) in client.session.subscriptions()) or None
+        super(StompProcessDispatcher, self).__init__(client, handler, ack, maxInFlight, timeout, errorDestination, executor)
+
+    def _createExecutor(self):
+        return futures.ProcessPoolExecutor()
+
+    def _submit(self, executor, frame):
+        body = frame.body
+        if isinstance(body, (memoryview, StompFileBody)): # a zero-copy body references the parser's receive buffer, a spooled one a file
+            body = body.tobytes()
+        return executor.submit(self._handler, dict(frame.headers), body)
+
+def prefetchSize(headers):
+    """The prefetch size which the **headers** of a **SUBSCRIBE** frame ask the broker for (0 if there is none).
+
+    .. seealso :: :data:`PREFETCH_HEADERS` for the supported (broker-specific) headers.
+    """
+    for header in PREFETCH_HEADERS:
+        try:
+            return int((headers or {})[header])
+        except (KeyError, ValueError):
+            pass
+    return 0
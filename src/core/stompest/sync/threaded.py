@@ -0,0 +1,304 @@
+"""Share one synchronous client among several threads.
+
+The :class:`~.sync.client.Stomp` client is not thread-safe. Instead of opening one broker connection per thread, you may wrap a connected client in a :class:`ThreadSafeStomp` object: any thread may then send frames, which are queued and written to the wire by a dedicated writer thread. The writer drains the queue in batches, so that many frames which are sent at about the same time are written with a single system call. Optionally, a reader thread receives and parses incoming frames in the background, so that reading from the network and processing the frames overlap.
+
+A :class:`HeartBeatThread` takes care of STOMP heart-beating, independently of what the application thread is doing.
+
+**Example**:
+
+>>> client = Stomp(CONFIG)
+>>> client.connect()
+>>> shared = ThreadSafeStomp(client)
+>>> shared.start()
+>>> # from any thread:
+>>> shared.send('/queue/test', b'test message')
+>>> # prefetch up to 100 incoming frames in the background:
+>>> shared = ThreadSafeStomp(client, maxPrefetch=100)
+>>> shared.start()
+>>> for frame in shared.frames(timeout=1):
+...     shared.ack(frame)
+...
+>>> # when all threads are done:
+>>> shared.stop()
+>>> client.disconnect()
+
+"""
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue # @UnresolvedImport
+
+from stompest.error import StompConnectionError
+
+LOG_CATEGORY = __name__
+
+class ThreadSafeStomp(object):
+    """A thread-safe front end for a :class:`~.sync.client.Stomp` client. The frames are created (and checked against the :class:`~.StompSession`) in the sending thread, so that invalid commands fail right away. They are then put into a bounded queue which is drained by a writer thread. A sender blocks while the queue is full.
+
+    :param client: A :class:`~.sync.client.Stomp` client. It should be connected and have subscribed to its destinations before you :meth:`start` the writer thread.
+    :param maxQueued: The maximum number of frames which are waiting to be written.
+    :param maxBatch: The maximum number of frames which are written at once.
+    :param maxPrefetch: If not :obj:`None`, :meth:`start` also starts a reader thread which receives up to this many frames ahead of the consumer. Iterate over :meth:`frames` to consume them. While the prefetch queue is full, the reader thread does not read from the connection, so that TCP flow control throttles the broker.
+
+    .. note :: Without a reader thread, receiving frames is not affected by this wrapper: call :meth:`~.sync.client.Stomp.canRead` and :meth:`~.sync.client.Stomp.receiveFrame` (or :meth:`~.sync.client.Stomp.receiveFrames`) of the wrapped :attr:`client` from a single thread. With a reader thread, do not call them at all. Connecting, subscribing, unsubscribing, and disconnecting are not thread-safe either: do this while the writer is stopped. As the writer thread batches frames by itself, you should not configure a **writeBufferSize** for the wrapped client.
+    """
+    MAX_QUEUED = 1024
+    MAX_BATCH = 256
+    POLL_INTERVAL = 0.1 # the time (in seconds) after which the reader thread checks whether it is supposed to stop
+
+    def __init__(self, client, maxQueued=None, maxBatch=None, maxPrefetch=None):
+        self.log = logging.getLogger(LOG_CATEGORY)
+        self.client = client
+        self.maxBatch = maxBatch or self.MAX_BATCH
+        self.maxPrefetch = maxPrefetch
+        self._queue = queue.Queue(maxQueued or self.MAX_QUEUED)
+        self._error = None
+        self._writer = None
+        self._reader = None
+        self._readError = None
+        self._prefetched = None
+
+    def start(self):
+        """Start the writer thread."""
+        if self._writer:
+            raise StompConnectionError('Writer thread is already running')
+        self._error = None
+        self._writer = threading.Thread(target=self._write, name='%s writer' % self.__class__.__name__)
+        self._writer.daemon = True
+        self._writer.start()
+        if self.maxPrefetch:
+            self._prefetched = queue.Queue(self.maxPrefetch + 1) # one more for the end marker
+            self._consumed = threading.Event()
+            self._stopped = threading.Event()
+            self._readError = None
+            self._reader = threading.Thread(target=self._read, name='%s reader' % self.__class__.__name__)
+            self._reader.daemon = True
+            self._reader.start()
+
+    def stop(self, timeout=None):
+        """Write all queued frames and stop the writer thread.
+
+        :param timeout: This is the time (in seconds) to wait for the writer thread to finish. If :obj:`None`, we will wait indefinitely.
+
+        .. note :: If the writer thread failed to send frames, this method will raise the :class:`~.StompConnectionError` which occurred.
+        """
+        writer, reader = self._writer, self._reader
+        if not writer:
+            return
+        if reader:
+            self._stopped.set()
+            reader.join(timeout)
+            self._reader = None
+        self._queue.put(None)
+        writer.join(timeout)
+        self._writer = None
+        self._raise()
+
+    def frames(self, timeout=None):
+        """Iterate over the frames which are received by the reader thread. The iteration ends if no frame arrives in time, or after the reader thread has been stopped and all frames it has received have been consumed. Heart-beats are not included.
+
+        :param timeout: This is the time (in seconds) to wait for each frame. If :obj:`None`, we will wait indefinitely.
+
+        .. note :: If the connection was lost, this method will raise the :class:`~.StompConnectionError` which occurred in the reader thread, after all frames received before have been consumed.
+        """
+        if self._prefetched is None:
+            raise StompConnectionError('Reader thread is not running')
+        while True:
+            try:
+                frame = self._prefetched.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if frame is None: # the reader thread has stopped: leave the end marker for the next consumer
+                self._prefetched.put(None)
+                if self._readError is not None:
+                    raise StompConnectionError('Reader thread failed [%s]' % self._readError)
+                return
+            self._consumed.set()
+            yield frame
+
+    def flush(self):
+        """Wait until all frames queued so far have been written to the wire.
+
+        .. note :: If the writer thread failed to send frames, this method will raise the :class:`~.StompConnectionError` which occurred.
+        """
+        self._queue.join()
+        self._raise()
+
+    # STOMP frames
+
+    def send(self, destination, body=b'', headers=None, receipt=None):
+        """Queue a **SEND** frame. The parameters are the same as for :meth:`~.sync.client.Stomp.send`."""
+        self.sendFrame(self.client.session.send(destination, body, headers, receipt))
+
+    def sendMany(self, destination, bodies=None, headers=None):
+        """Queue a batch of **SEND** frames. The parameters are the same as for :meth:`~.sync.client.Stomp.sendMany`."""
+        for frame in self.client.session.sendMany(destination, bodies, headers):
+            self.sendFrame(frame)
+
+    def ack(self, frame, receipt=None):
+        """Queue an **ACK** frame for a received **MESSAGE** frame."""
+        self.sendFrame(self.client.session.ack(frame, receipt))
+
+    def nack(self, frame, receipt=None):
+        """Queue a **NACK** frame for a received **MESSAGE** frame."""
+        self.sendFrame(self.client.session.nack(frame, receipt))
+
+    def begin(self, transaction=None, receipt=None):
+        """Queue a **BEGIN** frame to begin a STOMP transaction."""
+        self.sendFrame(self.client.session.begin(transaction, receipt))
+
+    def abort(self, transaction=None, receipt=None):
+        """Queue an **ABORT** frame to abort a STOMP transaction."""
+        self.sendFrame(self.client.session.abort(transaction, receipt))
+
+    def commit(self, transaction=None, receipt=None):
+        """Queue a **COMMIT** frame to commit a STOMP transaction."""
+        self.sendFrame(self.client.session.commit(transaction, receipt))
+
+    def sendFrame(self, frame):
+        """Queue a raw STOMP frame.
+
+        .. note :: If the writer thread is not running, or if it failed to send frames, this method will raise a :class:`~.StompConnectionError`.
+        """
+        if not self._writer:
+            raise StompConnectionError('Writer thread is not running')
+        self._raise()
+        self._queue.put(frame)
+
+    def _raise(self):
+        error = self._error
+        if error is not None:
+            raise StompConnectionError('Writer thread failed [%s]' % error)
+
+    def _read(self):
+        try:
+            while not self._stopped.is_set():
+                self._consumed.clear()
+                free = self.maxPrefetch - self._prefetched.qsize()
+                if free <= 0: # stop reading, so that the broker is throttled by TCP flow control
+                    self._consumed.wait(self.POLL_INTERVAL)
+                    continue
+                for frame in self.client.receiveFrames(free, self.POLL_INTERVAL):
+                    self._prefetched.put(frame)
+        except Exception as e:
+            self.log.error('Could not receive frames [%s]' % e)
+            self._readError = e
+        finally:
+            self._prefetched.put(None)
+
+    def _write(self):
+        running = True
+        while running:
+            items = [self._queue.get()]
+            while len(items) < self.maxBatch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            frames = items
+            if None in items: # stop() was called: write what was queued before
+                frames = items[:items.index(None)]
+                running = False
+            try:
+                if frames and (self._error is None):
+                    self.client.writeFrames(frames) # never closes the client which other threads are using
+            except Exception as e:
+                self.log.error('Could not send frames [%s]' % e)
+                self._error = e
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+class HeartBeatThread(object):
+    """Heart-beat in a background thread, based on the heart-beat periods negotiated by :meth:`~.sync.client.Stomp.connect`. The thread sends a heart-beat when the client has not sent anything for a while, and it shuts down the connection (see :meth:`~.sync.client.Stomp.shutdown`) when the broker has not sent anything for too long. As long as data from the broker is waiting to be received (see :meth:`~.sync.client.Stomp.dataWaiting`), the broker is considered alive, even if the application thread has not read its latest heart-beats yet. This way, a long-running message handler does not get the connection dropped by the broker, and a dead broker is detected even if the application thread waits for incoming frames indefinitely.
+
+    :param client: A connected :class:`~.sync.client.Stomp` client.
+    :param thresholds: tolerance thresholds (relative to the negotiated heart-beat periods). The default :obj:`None` is equivalent to the content of the class attribute :attr:`DEFAULT_THRESHOLDS`. Example: ``{'client': 0.6, 'server': 2.5}`` means that a heart-beat is sent if the client had shown no activity for 60 % of the negotiated client heart-beat period and that the connection is shut down if the server has shown no activity for 250 % of the negotiated server heart-beat period.
+
+    **Example**:
+
+    >>> client = Stomp(StompConfig('tcp://localhost:61613', version=StompSpec.VERSION_1_1))
+    >>> client.connect(heartBeats=(1000, 1000))
+    >>> heartBeats = HeartBeatThread(client)
+    >>> heartBeats.start()
+    >>> client.subscribe('/queue/test', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT_INDIVIDUAL})
+    >>> while client.canRead(): # raises StompConnectionError if the broker has stopped heart-beating
+    ...     frame = client.receiveFrame()
+    ...     handle(frame) # this may take longer than the heart-beat periods
+    ...     client.ack(frame)
+    ...
+    >>> heartBeats.stop()
+    >>> client.disconnect()
+
+    .. note :: The heart-beats are written with :meth:`~.sync.client.Stomp.writeFrames`, which serializes them with all other writes to the client's transport. The heart-beat thread never closes the client: if heart-beating fails, it only shuts down the connection, and the application thread's next attempt to receive a frame raises a :class:`~.StompConnectionError`. This is safe while the application thread keeps using the client, but a heart-beat thread must not outlive the connection: stop it before you disconnect.
+    """
+    DEFAULT_THRESHOLDS = {'client': 0.8, 'server': 2.0}
+
+    def __init__(self, client, thresholds=None):
+        self.log = logging.getLogger(LOG_CATEGORY)
+        self.client = client
+        self.error = None
+        self._thresholds = thresholds or self.DEFAULT_THRESHOLDS
+        self._dataSeen = 0 # when we last found unread data from the broker
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start heart-beating. If no heart-beating was negotiated, the thread ends right away."""
+        if self._thread:
+            raise StompConnectionError('Heart-beat thread is already running')
+        self.error = None
+        self._dataSeen = 0
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop heart-beating.
+
+        :param timeout: This is the time (in seconds) to wait for the heart-beat thread to finish. If :obj:`None`, we will wait indefinitely.
+        """
+        thread = self._thread
+        if not thread:
+            return
+        self._stopped.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _beatRemaining(self, which):
+        session = self.client.session
+        heartBeat = {'client': session.clientHeartBeat, 'server': session.serverHeartBeat}[which]
+        if not heartBeat:
+            return -1
+        last = {'client': session.lastSent, 'server': max(session.lastReceived, self._dataSeen)}[which]
+        elapsed = time.time() - last
+        return max((self._thresholds[which] * heartBeat / 1000.0) - elapsed, 0)
+
+    def _run(self):
+        try:
+            while True:
+                remaining = []
+                for which in ('client', 'server'):
+                    remainingTime = self._beatRemaining(which)
+                    if remainingTime < 0:
+                        continue
+                    if not remainingTime:
+                        if which == 'client':
+                            self.client.writeFrames([self.client.session.beat()]) # never closes the client which the application thread is using
+                        elif self.client.dataWaiting(): # the broker is alive, but the application thread is busy
+                            self._dataSeen = time.time()
+                        else:
+                            raise StompConnectionError('Server heart-beat timeout')
+                        remainingTime = self._beatRemaining(which)
+                    remaining.append(remainingTime)
+                if (not remaining) or self._stopped.wait(min(remaining)):
+                    return
+        except Exception as e:
+            self.log.error('Heart-beating failed [%s]' % e)
+            self.error = e
+            self.client.shutdown()
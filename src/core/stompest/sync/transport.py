@@ -1,31 +1,73 @@
 from __future__ import unicode_literals
 
 import errno
+import itertools
 import select # @UnresolvedImport
 import socket
+import threading
 import time
 
+try:
+    import selectors # @UnresolvedImport
+except ImportError: # Python 2 and Python 3.3
+    selectors = None
+
 import sys
-from stompest._backwards import binaryType
+from stompest._backwards import binaryType, joinBuffers
 from stompest.error import StompConnectionError
-from stompest.protocol import StompParser
+from stompest.protocol import StompFileBody, StompParser
+from stompest.protocol.util import byteView
+
+class StompTransportStats(object):
+    """Receive statistics of a connection.
+    
+    :param readSize: The current number of bytes requested per receive.
+    """
+    def __init__(self, readSize):
+        self.readSize = readSize
+        self.receives = 0
+        self.bytesReceived = 0
+
+    def __repr__(self):
+        return '%s(readSize=%d, receives=%d, bytesReceived=%d)' % (self.__class__.__name__, self.readSize, self.receives, self.bytesReceived)
+
+    @property
+    def bytesPerReceive(self):
+        """The average number of bytes per receive."""
+        return (self.bytesReceived / float(self.receives)) if self.receives else 0.0
 
 class StompFrameTransport(object):
     factory = StompParser
 
-    READ_SIZE = 4096
+    READ_SIZE = 4096 # the initial (and minimum) number of bytes requested per receive
+    MAX_READ_SIZE = 262144 # the default cap: sustained full reads double the read size up to this limit
+    JOIN_SIZE = 65536 # without scatter-gather I/O, small buffers are joined up to this size and sent at once
+    MAX_BUFFERS = 1024 # the maximum number of buffers per sendmsg call (IOV_MAX on common platforms)
 
-    def __init__(self, host, port, sslContext=None):
+    def __init__(self, host, port, sslContext=None, lazyHeaders=False, zeroCopy=False, writeBufferSize=None, maxReadSize=None, socketOptions=None, spoolSize=None, spool=None, stream=None):
         self.host = host
         self.port = port
         self.sslContext = sslContext
+        self.socketOptions = socketOptions or []
+        self.writeBufferSize = writeBufferSize
+        self.maxReadSize = max(self.READ_SIZE, self.MAX_READ_SIZE if (maxReadSize is None) else maxReadSize)
+        self.stats = StompTransportStats(self.READ_SIZE)
 
         self._socket = None
-        self._parser = self.factory()
+        self._selector = None
+        self._parser = self.factory(lazyHeaders=lazyHeaders, zeroCopy=zeroCopy, spoolSize=spoolSize, spool=spool, stream=stream)
+        self._writeBuffer = []
+        self._writeBufferSize = 0
+        self._writeLock = threading.RLock() # a heart-beat thread may write concurrently with the application thread
 
     def __str__(self):
         return '%s:%d' % (self.host, self.port)
 
+    @property
+    def connected(self):
+        """Whether the connection is (still) established. A connection is considered lost as soon as sending or receiving fails, so this property does not need a system call."""
+        return self._connected()
+
     def canRead(self, timeout=None):
         def retry():
             if timeout is None:
@@ -36,10 +78,15 @@ class StompFrameTransport(object):
         self._check()
         if self._parser.canRead():
             return True
+        if self.sslContext and self._socket.pending(): # decrypted data buffered by the SSL layer does not make the socket readable
+            return True
 
+        self.flush() # we are about to wait for the broker, which might be waiting for us
         startTime = time.time()
         try:
-            if timeout is None:
+            if self._selector:
+                files = self._selector.select(timeout)
+            elif timeout is None:
                 files, _, _ = select.select([self._socket], [], [])
             else:
                 files, _, _ = select.select([self._socket], [], [], timeout)
@@ -58,43 +105,104 @@ class StompFrameTransport(object):
                 return retry()
             raise
 
+        if not files: # the connection is idle
+            self.stats.readSize = self.READ_SIZE
         return bool(files)
 
     def connect(self, timeout=None):
         try:
             self._socket = socket.socket()
+            for (level, option, value) in self.socketOptions:
+                self._socket.setsockopt(level, option, value)
             self._socket.settimeout(timeout)
             if self.sslContext:
                 self._socket = self.sslContext.wrap_socket(self._socket, server_hostname=self.host)
             self._socket.connect((self.host, self.port))
         except IOError as e:
             raise StompConnectionError('Could not establish connection [%s]' % e)
+        if selectors:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._socket, selectors.EVENT_READ)
         self._parser.reset()
+        self.stats = StompTransportStats(self.READ_SIZE)
+
+    def dataWaiting(self):
+        """Whether there is incoming data which has not been received yet, or a frame which has been received but not consumed. This method does not read from the connection, and it may be called from any thread."""
+        socket_ = self._socket
+        if socket_ is None:
+            return False
+        if self._parser.canRead() or (self.sslContext and socket_.pending()):
+            return True
+        try:
+            fileno = socket_.fileno()
+        except IOError: # Python 2: the connection was closed meanwhile
+            return False
+        if fileno < 0: # the connection was closed meanwhile
+            return False
+        return _readable(fileno)
 
     def disconnect(self):
         try:
-            self._socket and self._socket.close()
-        except IOError as e:
-            raise StompConnectionError('Could not close connection cleanly [%s]' % e)
+            self.flush()
         finally:
-            self._socket = None
+            self._close()
+
+    def flush(self):
+        """Write all buffered frames to the connection. This is only needed if the transport was created with a **writeBufferSize**."""
+        if not self._writeBuffer:
+            return
+        with self._writeLock:
+            buffers = self._writeBuffer
+            self._writeBuffer = []
+            self._writeBufferSize = 0
+            self._write(buffers)
 
     def receive(self):
         while True:
             frame = self._parser.get()
             if frame is not None:
                 return frame
+            self.flush()
+            readSize = self.stats.readSize
             try:
-                data = self._socket.recv(self.READ_SIZE)
-                if not data:
+                size = self._socket.recv_into(self._parser.getBuffer(readSize), readSize)
+                if not size:
                     raise StompConnectionError('No more data')
             except (IOError, StompConnectionError) as e:
-                self.disconnect()
+                self._close()
                 raise StompConnectionError('Connection closed [%s]' % e)
-            self._parser.add(data)
+            self._received(size)
+            self._parser.bufferUpdated(size)
+
+    def receiveBuffered(self):
+        """Return the next frame which has already been received and parsed, or :obj:`None` if there is none. This method never reads from the connection."""
+        return self._parser.get()
 
     def send(self, frame):
-        self._write(binaryType(frame))
+        self._send(frame.buffers())
+
+    def sendMany(self, frames):
+        """Send several frames at once: without a write buffer, all of them are written with as few system calls as possible."""
+        self._send([data for frame in frames for data in frame.buffers()])
+
+    def writeFrames(self, frames):
+        """Write several frames to the connection right away, together with all buffered frames. As opposed to :meth:`sendMany`, this method may be called from any thread: if writing fails, the connection is shut down (see :meth:`shutdown`) rather than closed, so that cleaning up is left to the thread which receives from the connection."""
+        buffers = [data for frame in frames for data in frame.buffers()]
+        with self._writeLock:
+            buffers = self._writeBuffer + buffers
+            self._writeBuffer = []
+            self._writeBufferSize = 0
+            self._write(buffers, close=False)
+
+    def shutdown(self):
+        """Shut down the connection in both directions without closing it. As opposed to :meth:`disconnect`, this method may be called from any thread: a thread which is waiting for incoming data wakes up and fails to read from the connection."""
+        socket_ = self._socket
+        if socket_ is None:
+            return
+        try:
+            socket_.shutdown(socket.SHUT_RDWR)
+        except IOError: # the connection is already gone
+            pass
 
     def setVersion(self, version):
         self._parser.version = version
@@ -103,12 +211,123 @@ class StompFrameTransport(object):
         if not self._connected():
             raise StompConnectionError('Not connected')
 
+    def _send(self, buffers):
+        with self._writeLock:
+            if not self.writeBufferSize:
+                self._write(buffers)
+                return
+            self._check()
+            buffers = [data if isinstance(data, (binaryType, StompFileBody)) else byteView(data).tobytes() for data in buffers] # the caller may reuse a mutable body as soon as we return
+            self._writeBuffer.extend(buffers)
+            self._writeBufferSize += sum(len(data) for data in buffers)
+            if self._writeBufferSize >= self.writeBufferSize:
+                self.flush()
+
+    def _close(self):
+        self._writeBuffer = []
+        self._writeBufferSize = 0
+        try:
+            self._selector and self._selector.close()
+            self._socket and self._socket.close()
+        except IOError as e:
+            raise StompConnectionError('Could not close connection cleanly [%s]' % e)
+        finally:
+            self._selector = None
+            self._socket = None
+
     def _connected(self):
         return self._socket is not None
 
-    def _write(self, data):
+    def _received(self, size):
+        stats = self.stats
+        stats.receives += 1
+        stats.bytesReceived += size
+        if size == stats.readSize: # more data is probably waiting
+            stats.readSize = min(2 * stats.readSize, self.maxReadSize)
+        elif 4 * size < stats.readSize:
+            stats.readSize = max(stats.readSize // 2, self.READ_SIZE)
+
+    def _sendall(self, socket_, buffers):
+        joined, size = [], 0
+        for data in buffers:
+            data = byteView(data)
+            if len(data) >= self.JOIN_SIZE:
+                if joined:
+                    socket_.sendall(joinBuffers(joined))
+                    joined, size = [], 0
+                socket_.sendall(data)
+                continue
+            joined.append(data)
+            size += len(data)
+            if size >= self.JOIN_SIZE:
+                socket_.sendall(joinBuffers(joined))
+                joined, size = [], 0
+        if joined:
+            socket_.sendall(joinBuffers(joined))
+
+    def _sendfile(self, socket_, body):
+        position = body.file.tell()
+        try:
+            if hasattr(socket_, 'sendfile'): # os.sendfile() if possible, otherwise a loop over reads and sends
+                size = socket_.sendfile(body.file, body.offset, body.size)
+            else:
+                size = 0
+                for start in range(0, body.size, self.JOIN_SIZE):
+                    data = body[start:start + self.JOIN_SIZE]
+                    socket_.sendall(data)
+                    size += len(data)
+                    if len(data) < min(self.JOIN_SIZE, body.size - start): # the file ended early
+                        break
+        finally:
+            body.file.seek(position)
+        if size != body.size: # the content-length header is wrong now, and the broker would misread the rest of the stream
+            raise IOError('File body ended early [sent %d of %d bytes]' % (size, body.size))
+
+    def _sendmsg(self, socket_, buffers):
+        buffers = [data for data in map(byteView, buffers) if len(data)]
+        start = 0
+        while start < len(buffers):
+            size = socket_.sendmsg(buffers[start:start + self.MAX_BUFFERS])
+            while size: # skip what has been sent, and resume a partial write where it stopped
+                if size < len(buffers[start]):
+                    buffers[start] = buffers[start][size:]
+                    break
+                size -= len(buffers[start])
+                start += 1
+
+    def _write(self, buffers, close=True):
         self._check()
+        socket_ = self._socket # another thread may close the connection (and reset the attribute) while we are writing
+        if socket_ is None:
+            raise StompConnectionError('Not connected')
         try:
-            self._socket.sendall(data)
+            for (isFile, group) in itertools.groupby(buffers, lambda data: isinstance(data, StompFileBody)):
+                if isFile:
+                    for body in group:
+                        self._sendfile(socket_, body)
+                elif hasattr(socket_, 'sendmsg') and not self.sslContext:
+                    self._sendmsg(socket_, list(group))
+                else: # SSL sockets (and some platforms) do not support sendmsg
+                    self._sendall(socket_, group)
         except IOError as e:
+            if close:
+                self._close()
+            else: # another thread may be using the connection
+                self.shutdown()
             raise StompConnectionError('Could not send to connection [%s]' % e)
+
+def _readable(fileno):
+    """Whether a file descriptor is readable right now. In contrast to :func:`select.select`, this works for file descriptors beyond FD_SETSIZE, too."""
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(fileno, select.POLLIN)
+        return bool(poller.poll(0))
+    if selectors:
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(fileno, selectors.EVENT_READ)
+            return bool(selector.select(0))
+        finally:
+            selector.close()
+    files, _, _ = select.select([fileno], [], [], 0)
+    return bool(files)
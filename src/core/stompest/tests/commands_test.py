@@ -1,7 +1,12 @@
+import array
+import mmap
+import pickle
+import tempfile
 import unittest
 
+from stompest._backwards import binaryType
 from stompest.error import StompProtocolError
-from stompest.protocol import commands, StompSpec, StompFrame
+from stompest.protocol import commands, StompFileBody, StompSendTemplate, StompSpec, StompFrame
 
 class CommandsTest(unittest.TestCase):
     def test_connect(self):
@@ -43,6 +48,86 @@ class CommandsTest(unittest.TestCase):
         self.assertEqual(commands.disconnect(), StompFrame(StompSpec.DISCONNECT))
         self.assertEqual(commands.disconnect(receipt='4711'), StompFrame(StompSpec.DISCONNECT, {StompSpec.RECEIPT_HEADER: '4711'}))
 
+    def test_send_file_body(self):
+        with tempfile.TemporaryFile() as file_:
+            file_.write(b'skipped\x00binary\x00body')
+            file_.seek(8)
+            frame = commands.send('/queue/test', file_)
+            self.assertTrue(isinstance(frame.body, StompFileBody))
+            self.assertEqual(11, len(frame.body))
+            self.assertEqual('11', frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+            self.assertEqual(b'binary', frame.body[:6])
+            self.assertEqual(8, file_.tell())
+            expected = StompFrame(StompSpec.SEND, {StompSpec.DESTINATION_HEADER: '/queue/test', StompSpec.CONTENT_LENGTH_HEADER: '11'}, b'binary\x00body')
+            self.assertEqual(bytes(expected), bytes(frame))
+            self.assertEqual(8, file_.tell())
+
+            frame = commands.send('/queue/test', file_, {StompSpec.CONTENT_LENGTH_HEADER: '6'})
+            self.assertEqual('6', frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+
+            buffer_ = mmap.mmap(file_.fileno(), 0)
+            try:
+                frame = commands.send('/queue/test', buffer_)
+                self.assertEqual('19', frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+                self.assertEqual(b'skipped\x00binary\x00body\x00', bytes(frame)[-20:])
+            finally:
+                buffer_.close()
+
+    def test_send_buffer_body(self):
+        body = array.array('i', range(10))
+        frame = commands.send('/queue/test', body)
+        self.assertIs(body, frame.body)
+        self.assertEqual('40', frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+
+    def test_send_template(self):
+        template = StompSendTemplate('/queue/test', {'persistent': 'true', 'priority': '4'})
+        for version in StompSpec.VERSIONS:
+            headers = {'correlation-id': '4711', 'priority': '9'}
+            frame = commands.send(template, b'hello', headers, receipt='0815', version=version)
+            expected = commands.send('/queue/test', b'hello', {'persistent': 'true', 'correlation-id': '4711', 'priority': '9'}, receipt='0815', version=version)
+            self.assertEqual(frame, expected)
+            self.assertEqual(frame.headers, expected.headers)
+            self.assertEqual(headers, {'correlation-id': '4711', 'priority': '9'})
+
+            frame.setContentLength()
+            expected.setContentLength()
+            self.assertEqual(frame, expected)
+            self.assertEqual(frame.headers, expected.headers)
+
+            self.assertEqual(commands.send(template, version=version), StompFrame(StompSpec.SEND, template.headers, version=version))
+
+    def test_send_template_headers_are_mutable(self):
+        template = StompSendTemplate('/queue/test', {'persistent': 'true', 'priority': '4'})
+        for version in StompSpec.VERSIONS:
+            frame = commands.send(template, b'hello', {'correlation-id': '4711'}, version=version)
+            expected = commands.send('/queue/test', b'hello', {'persistent': 'true', 'priority': '4', 'correlation-id': '4711'}, version=version)
+            headers = frame.headers
+            self.assertIs(headers, frame.headers)
+            self.assertIsInstance(headers, dict)
+            self.assertEqual(binaryType(frame), binaryType(expected))
+
+            headers['priority'] = '9'
+            expected.headers['priority'] = '9'
+            self.assertEqual(binaryType(frame), binaryType(expected))
+            del frame.headers['persistent']
+            del expected.headers['persistent']
+            self.assertEqual(binaryType(frame), binaryType(expected))
+            frame.headers.setdefault('reply-to', '/queue/reply')
+            expected.headers.setdefault('reply-to', '/queue/reply')
+            self.assertEqual(binaryType(frame), binaryType(expected))
+            self.assertEqual(frame.headers, expected.headers)
+            self.assertEqual(pickle.loads(pickle.dumps(frame)), expected)
+
+            frame.headers = {'destination': '/queue/other'}
+            self.assertEqual(binaryType(frame), binaryType(StompFrame(StompSpec.SEND, {'destination': '/queue/other'}, b'hello', version=version)))
+            self.assertEqual({'persistent': 'true', 'priority': '4', 'destination': '/queue/test'}, template.headers)
+
+            frame = commands.send(template, b'hello', version=version)
+            frame.setContentLength()
+            self.assertEqual(binaryType(frame), binaryType(commands.send('/queue/test', b'hello', {'persistent': 'true', 'priority': '4', 'content-length': '5'}, version=version)))
+            frame.headers['priority'] = '9'
+            self.assertEqual(binaryType(frame), binaryType(commands.send('/queue/test', b'hello', {'persistent': 'true', 'priority': '9', 'content-length': '5'}, version=version)))
+
     def test_connected(self):
         self.assertEqual(commands.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.SESSION_HEADER: 'hi'})), (StompSpec.VERSION_1_0, None, 'hi', (0, 0)))
         self.assertEqual(commands.connected(StompFrame(StompSpec.CONNECTED, {})), (StompSpec.VERSION_1_0, None, None, (0, 0)))
@@ -0,0 +1,42 @@
+import gc
+import tracemalloc
+
+from stompest._backwards import binaryType
+from stompest.protocol import StompFrame, StompParser, StompSpec
+
+N = 50000
+
+messageFrame = StompFrame(
+    command='MESSAGE'
+    , headers={StompSpec.DESTINATION_HEADER: '/queue/test', StompSpec.MESSAGE_ID_HEADER: '007', StompSpec.SUBSCRIPTION_HEADER: '0'}
+    , body=b'small body'
+    , version=StompSpec.VERSION_1_2
+)
+
+def createRange(n):
+    j = 0
+    while j < n:
+        yield j
+        j += 1
+
+def buffered(**kwargs):
+    """Parse N frames and keep them buffered (as :class:`~.sync.client.Stomp` does with prefetched messages). Returns the number of bytes allocated per buffered frame."""
+    parser = StompParser(version=StompSpec.VERSION_1_2, **kwargs)
+    data = N * binaryType(messageFrame)
+    gc.collect()
+    tracemalloc.start()
+    parser.add(data)
+    frames = []
+    while parser.canRead():
+        frame = parser.get()
+        frame.headers # the client looks up the message id of each prefetched message
+        frames.append(frame)
+    del parser
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(frames)
+
+if __name__ == '__main__':
+    for kwargs in ({}, {'lazyHeaders': True}, {'zeroCopy': True}):
+        print('%s: %.0f bytes per buffered frame' % (kwargs or 'default', buffered(**kwargs)))
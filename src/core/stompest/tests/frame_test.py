@@ -1,7 +1,13 @@
+import array
+import copy
+import sys
+import tempfile
 import unittest
 
-from stompest._backwards import binaryType
-from stompest.protocol import StompFrame, StompSpec
+from stompest._backwards import binaryType, textType
+from stompest.error import StompFrameError
+from stompest.protocol import StompFileBody, StompFrame, StompSpec
+from stompest.protocol.util import byteView, escape, unescape
 
 class StompFrameTest(unittest.TestCase):
     def test_frame(self):
@@ -55,6 +61,16 @@ lines\x00""" % (StompSpec.SEND, StompSpec.DESTINATION_HEADER)).encode())
         frame = StompFrame(StompSpec.MESSAGE, headers, body)
         self.assertEqual(frame.body, body)
         self.assertEqual(binaryType(frame), b'MESSAGE\ncontent-length:4\n\n\xf0\x00\n\t\x00')
+        buffers = frame.buffers()
+        self.assertEqual(buffers, [b'MESSAGE\ncontent-length:4\n\n', body, b'\x00'])
+        self.assertIs(buffers[1], body)
+
+    def test_buffer_body_content_length(self):
+        body = array.array('i', range(10))
+        frame = StompFrame(StompSpec.MESSAGE, body=body)
+        frame.setContentLength()
+        self.assertEqual(textType(body.itemsize * len(body)), frame.headers[StompSpec.CONTENT_LENGTH_HEADER])
+        self.assertEqual(b'MESSAGE\ncontent-length:40\n\n' + byteView(body).tobytes() + b'\x00', binaryType(frame))
 
     def test_duplicate_headers(self):
         rawHeaders = (('foo', 'bar1'), ('foo', 'bar2'))
@@ -76,6 +92,80 @@ lines\x00""" % (StompSpec.SEND, StompSpec.DESTINATION_HEADER)).encode())
         rawFrame = b'SEND\nfoo:bar1\n\nsome stuff\nand more\x00'
         self.assertEqual(binaryType(frame), rawFrame)
 
+    def test_raw_headers_cache(self):
+        frame = StompFrame(StompSpec.MESSAGE, rawHeaders=[('foo', 'bar1'), ('foo', 'bar2')])
+        headers = frame.headers
+        self.assertEqual(headers, {'foo': 'bar1'})
+        self.assertIs(frame.headers, headers)
+
+        frame.rawHeaders.insert(0, ('foo', 'bar0'))
+        self.assertEqual(frame.headers, {'foo': 'bar0'})
+        self.assertEqual(frame.rawHeaders, [('foo', 'bar0'), ('foo', 'bar1'), ('foo', 'bar2')])
+
+        headers = frame.headers
+        headers['foo'] = 'bar3'
+        self.assertEqual(frame.headers, {'foo': 'bar0'})
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar0\nfoo:bar1\nfoo:bar2\n\n\x00')
+
+        frame.setContentLength()
+        self.assertEqual(frame.headers, {'foo': 'bar0', StompSpec.CONTENT_LENGTH_HEADER: '0'})
+
+        self.assertEqual(copy.deepcopy(frame).headers, frame.headers)
+
+    def test_serialization_cache(self):
+        frame = StompFrame(StompSpec.SEND, {'foo': 'bar'}, b'body')
+        self.assertEqual(binaryType(frame), b'SEND\nfoo:bar\n\nbody\x00')
+        self.assertIs(frame.buffers()[0], frame.buffers()[0])
+
+        frame.headers['foo'] = 'baz'
+        self.assertEqual(binaryType(frame), b'SEND\nfoo:baz\n\nbody\x00')
+        frame.headers.update(bar='foo')
+        self.assertEqual(binaryType(frame), b'SEND\nbar:foo\nfoo:baz\n\nbody\x00')
+        frame.headers = {'foo': 'bar'}
+        self.assertEqual(binaryType(frame), b'SEND\nfoo:bar\n\nbody\x00')
+        frame.command = StompSpec.MESSAGE
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar\n\nbody\x00')
+        frame.body = b'other body'
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar\n\nother body\x00')
+        frame.rawHeaders = [('foo', 'bar1'), ('foo', 'bar2')]
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar1\nfoo:bar2\n\nother body\x00')
+        frame.rawHeaders.pop()
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar1\n\nother body\x00')
+        frame.version = StompSpec.VERSION_1_1
+        frame.rawHeaders.append(('foo:', 'bar2'))
+        self.assertEqual(binaryType(frame), b'MESSAGE\nfoo:bar1\nfoo\\c:bar2\n\nother body\x00')
+
+    def test_equality(self):
+        frame = StompFrame(StompSpec.SEND, {'foo': 'bar'}, b'body')
+        self.assertEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, b'body'))
+        self.assertEqual(frame, StompFrame(StompSpec.SEND, body=b'body', rawHeaders=[('foo', 'bar')]))
+        self.assertEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, memoryview(b'body')))
+        self.assertEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, b'body', version=StompSpec.VERSION_1_1))
+        body = array.array('b', b'body')
+        self.assertEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, body))
+        with tempfile.TemporaryFile() as f:
+            f.write(b'body')
+            f.seek(0)
+            self.assertEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, StompFileBody(f)))
+        self.assertNotEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'baz'}, b'body'))
+        self.assertNotEqual(frame, StompFrame(StompSpec.SEND, {'foo': 'bar'}, b'other body'))
+        self.assertNotEqual(frame, StompFrame(StompSpec.SEND, body=b'body', rawHeaders=[('foo', 'bar'), ('foo', 'baz')]))
+        self.assertNotEqual(frame, StompFrame(StompSpec.MESSAGE, {'foo': 'bar'}, b'body'))
+        self.assertNotEqual(frame, None)
+
+    def test_equality_of_frames_which_do_not_render_alike(self):
+        self.assertNotEqual(StompFrame(StompSpec.SEND, {'a': 1}), StompFrame(StompSpec.SEND, {'a': True}))
+        self.assertNotEqual(StompFrame(StompSpec.SEND, rawHeaders=[('a', 1)]), StompFrame(StompSpec.SEND, rawHeaders=[('a', True)]))
+        self.assertEqual(StompFrame(StompSpec.SEND, {'a': 1}), StompFrame(StompSpec.SEND, {'a': '1'}))
+
+        frame = StompFrame(StompSpec.SEND, {'some french': b'fen\xc3\xaatre'.decode('utf-8')}, version=StompSpec.VERSION_1_0)
+        self.assertFalse(frame == StompFrame(StompSpec.SEND, {'some french': b'fen\xc3\xaatre'.decode('utf-8')}, version=StompSpec.VERSION_1_0))
+        self.assertFalse(frame == frame)
+
+        if sys.version_info[0] > 2: # Python 2 renders an ASCII text body
+            frame = StompFrame(StompSpec.SEND, body='text body')
+            self.assertFalse(frame == StompFrame(StompSpec.SEND, body='text body'))
+
     def test_non_string_headers(self):
         message = {'command': 'MESSAGE', 'headers': {123: 456}}
         frame = StompFrame(**message)
@@ -136,6 +226,18 @@ lines\x00""" % (StompSpec.SEND, StompSpec.DESTINATION_HEADER)).encode())
             frame.version = version
             self.assertEqual(binaryType(frame), frameBytes)
 
+    def test_escape_round_trip(self):
+        for version in (StompSpec.VERSION_1_1, StompSpec.VERSION_1_2):
+            escaper = escape(version, StompSpec.SEND)
+            unescaper = unescape(version, StompSpec.SEND)
+            text = 'plain header value'
+            self.assertIs(escaper(text), text)
+            self.assertIs(unescaper(text), text)
+            text = 'a:b\\c\nd'
+            self.assertEqual(unescaper(escaper(text)), text)
+            for text in ('a\\tb', 'a\\', 'a:b'):
+                self.assertRaises(StompFrameError, unescaper, text)
+
     def test_frame_info(self):
         frame = StompFrame(StompSpec.MESSAGE, headers={'a': 'c'}, body=b'More text than fits a short info.', version=StompSpec.VERSION_1_1)
         self.assertEqual(frame.info().replace("b'", "'").replace("u'", "'"), "MESSAGE frame [headers={'a': 'c'}, body='More text than fits ...', version=1.1]")
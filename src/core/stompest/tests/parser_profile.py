@@ -1,4 +1,5 @@
 import itertools
+import time
 from random import choice, randrange
 from string import printable
 
@@ -11,6 +12,7 @@ BLOCK_LENGTH = 1000
 BODY_BLOCKS = 1
 HEADER_LENGTH = 10
 SLICE = 4096
+BURST = 1000
 
 def createRange(n):
     j = 0
@@ -32,6 +34,12 @@ binaryFrame = StompFrame(
     , body=BODY_BLOCKS * BINARY_BLOCK
 )
 heartBeatFrame = StompHeartBeat()
+smallFrame = StompFrame(
+    command='MESSAGE'
+    , headers={StompSpec.DESTINATION_HEADER: '/queue/test', StompSpec.MESSAGE_ID_HEADER: '007', StompSpec.SUBSCRIPTION_HEADER: '0'}
+    , body=b'small body'
+    , version=StompSpec.VERSION_1_2
+)
 
 def testText():
     pass
@@ -48,8 +56,34 @@ def main():
         while parser.canRead():
             parser.get()
 
+def burst():
+    parser = StompParser(version=StompSpec.VERSION_1_2)
+    frames = BURST * binaryType(smallFrame) # many small frames delivered by a single read
+    for _ in createRange(N // 100):
+        parser.add(frames)
+        while parser.canRead():
+            parser.get()
+
+def timed(repeat=10, **kwargs):
+    """Parse bursts of small frames, and return the best time (in microseconds) per frame, so that parser versions may be compared without the overhead of the profiler."""
+    frames = BURST * binaryType(smallFrame)
+    best = None
+    for _ in createRange(repeat):
+        parser = StompParser(version=StompSpec.VERSION_1_2, **kwargs)
+        start = time.time()
+        for _ in createRange(N // 1000):
+            parser.add(frames)
+            while parser.canRead():
+                parser.get()
+        elapsed = time.time() - start
+        best = elapsed if (best is None) else min(best, elapsed)
+    return 1e6 * best / (BURST * (N // 1000))
+
 if __name__ == '__main__':
     import cProfile
     import pstats
-    cProfile.run('main()', 'parserstats')
-    pstats.Stats('parserstats').strip_dirs().sort_stats('cumtime').print_stats()
+    for kwargs in ({}, {'lazyHeaders': True}):
+        print('%s: %.1f us per small frame' % (kwargs or 'default', timed(**kwargs)))
+    for statement in ('main()', 'burst()'):
+        cProfile.run(statement, 'parserstats')
+        pstats.Stats('parserstats').strip_dirs().sort_stats('cumtime').print_stats()
@@ -1,8 +1,11 @@
+import io
+import json
+import sys
 import unittest
 
 from stompest._backwards import binaryType, textType
 from stompest.error import StompFrameError
-from stompest.protocol import commands, StompFrame, StompParser, StompSpec
+from stompest.protocol import commands, StompBodyStream, StompFileBody, StompFrame, StompParser, StompSpec
 from stompest.protocol.frame import StompHeartBeat
 
 class StompParserTest(unittest.TestCase):
@@ -234,6 +237,222 @@ class StompParserTest(unittest.TestCase):
 
         self.assertIsNone(parser.get())
 
+    def test_buffer_compaction_and_growth(self):
+        frames = [StompFrame(StompSpec.MESSAGE, {'x': textType(j)}, j * b'body') for j in range(50)]
+        frameBytes = b''.join(binaryType(frame) for frame in frames)
+        for (bufferSize, chunkSize) in [(1, 1), (16, 7), (64, 100), (4096, len(frameBytes))]:
+            parser = StompParser(bufferSize=bufferSize)
+            parsed = []
+            for j in range(0, len(frameBytes), chunkSize):
+                parser.add(frameBytes[j:j + chunkSize])
+                while parser.canRead():
+                    parsed.append(parser.get())
+            self.assertEqual(parsed, frames)
+            self.assertEqual((parser._start, parser._end), (0, 0))
+
+    def test_buffer_shrinks_when_empty(self):
+        frame = StompFrame(StompSpec.MESSAGE, body=b'x' * 100000)
+        parser = StompParser(bufferSize=1024)
+        parser.MAX_IDLE_BUFFER_SIZE = 4096
+        parser.add(binaryType(frame)[:50000])
+        self.assertTrue(len(parser._data) >= 50000)
+        parser.add(binaryType(frame)[50000:])
+        self.assertEqual(frame, parser.get())
+        self.assertEqual(1024, len(parser._data))
+
+        parser.add(binaryType(frame) + binaryType(frame)[:10]) # not empty: keep the buffer
+        self.assertTrue(len(parser._data) > 4096)
+        self.assertEqual(frame, parser.get())
+
+    def test_get_buffer(self):
+        frame = StompFrame(StompSpec.MESSAGE, {'x': 'y'}, b'testing 1 2 3')
+        frameBytes = 2 * binaryType(frame)
+        parser = StompParser(bufferSize=8)
+        j = 0
+        while j < len(frameBytes):
+            buffer = parser.getBuffer(5)
+            self.assertTrue(len(buffer) >= 5)
+            chunk = frameBytes[j:j + 5]
+            buffer[:len(chunk)] = chunk
+            del buffer
+            parser.bufferUpdated(len(chunk))
+            j += len(chunk)
+        self.assertEqual(parser.get(), frame)
+        self.assertEqual(parser.get(), frame)
+        self.assertIsNone(parser.get())
+        self.assertTrue(len(parser.getBuffer(-1)) > 0)
+
+    def test_zero_copy(self):
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.CONTENT_LENGTH_HEADER: '4'}, body) for body in (b'\x00one', b'\x00two')]
+        frameBytes = b''.join(binaryType(frame) for frame in frames)
+        parser = StompParser(bufferSize=len(frameBytes), zeroCopy=True)
+        parser.add(frameBytes)
+        chunk = parser._data
+        first, second = parser.get(), parser.get()
+        self.assertEqual([first, second], frames)
+        self.assertIsInstance(first.body, memoryview)
+        self.assertEqual(hasattr(memoryview, 'toreadonly'), first.body.readonly)
+
+        parser.add(frameBytes) # the previous frames are still alive: continue with a fresh chunk
+        self.assertIsNot(parser._data, chunk)
+        self.assertEqual(first.body, b'\x00one')
+        self.assertEqual(second.body, b'\x00two')
+        self.assertEqual([parser.get(), parser.get()], frames)
+
+        del first, second
+        chunk = parser._data
+        parser.add(frameBytes) # all frames have been dropped: reuse the chunk
+        self.assertIs(parser._data, chunk)
+        self.assertEqual([parser.get(), parser.get()], frames)
+
+    def test_spool(self):
+        body = 1000 * b'\x00spooled'
+        large = StompFrame(StompSpec.MESSAGE, {StompSpec.CONTENT_LENGTH_HEADER: textType(len(body))}, body)
+        small = StompFrame(StompSpec.MESSAGE, {StompSpec.CONTENT_LENGTH_HEADER: '5'}, b'small')
+        frameBytes = binaryType(large) + b'\n' + binaryType(small) + binaryType(large)
+
+        parser = StompParser(StompSpec.VERSION_1_1, bufferSize=128, spoolSize=1000)
+        for start in range(0, len(frameBytes), 100):
+            parser.add(frameBytes[start:start + 100])
+            self.assertTrue(len(parser._data) <= 256) # the receive buffer does not grow with the body
+        first, heartBeat, second, third = [parser.get() for _ in range(4)]
+        self.assertIsInstance(heartBeat, StompHeartBeat)
+        self.assertEqual(small, second)
+        for frame in (first, third):
+            self.assertIsInstance(frame.body, StompFileBody)
+            self.assertEqual(len(body), len(frame.body))
+            self.assertEqual(body, frame.body.tobytes())
+            self.assertEqual(body[:8], frame.body[:8])
+            self.assertEqual(binaryType(large), binaryType(frame))
+        self.assertIsNot(first.body.file, third.body.file)
+        self.assertEqual(None, parser.get())
+
+        sinks = []
+        def spool(frame):
+            self.assertEqual(StompSpec.MESSAGE, frame.command)
+            sinks.append(io.BytesIO())
+            sinks[-1].write(b'prefix')
+            return sinks[-1]
+        parser = StompParser(spoolSize=1, spool=spool)
+        parser.add(binaryType(small))
+        self.assertEqual(b'small', parser.get().body.tobytes())
+        self.assertEqual(b'prefixsmall', sinks[0].getvalue())
+
+        self.assertRaises(StompFrameError, parser.add, binaryType(small)[:-1] + b'\n')
+
+    def test_stream(self):
+        events, test = [], self
+        class Stream(StompBodyStream):
+            def __init__(self, frame):
+                super(Stream, self).__init__(frame)
+                events.append(('started', frame.headers.get('n')))
+            def received(self, chunk):
+                test.assertEqual(hasattr(memoryview, 'toreadonly'), chunk.readonly)
+                events.append(('received', chunk.tobytes()))
+            def completed(self):
+                events.append(('completed', self.frame.headers.get('n')))
+
+        def stream(frame):
+            if frame.headers.get('stream'):
+                return Stream(frame)
+
+        withLength = StompFrame(StompSpec.MESSAGE, {'n': '1', 'stream': 'yes', StompSpec.CONTENT_LENGTH_HEADER: '10'}, b'\x00123456789')
+        withoutLength = StompFrame(StompSpec.MESSAGE, {'n': '2', 'stream': 'yes'}, b'abcdef')
+        notStreamed = StompFrame(StompSpec.MESSAGE, {'n': '3', StompSpec.CONTENT_LENGTH_HEADER: '12'}, b'not streamed')
+        frameBytes = binaryType(withLength) + binaryType(withoutLength) + binaryType(notStreamed)
+
+        parser = StompParser(StompSpec.VERSION_1_1, stream=stream, spoolSize=1)
+        parser.add(frameBytes[:len(binaryType(withLength)) - 5])
+        self.assertEqual([('started', '1'), ('received', b'\x0012345')], events)
+        self.assertEqual(None, parser.get())
+        for start in range(len(binaryType(withLength)) - 5, len(frameBytes), 4):
+            parser.add(frameBytes[start:start + 4])
+        self.assertEqual(b'\x00123456789', b''.join(chunk for (event, chunk) in events[:4] if event == 'received'))
+        self.assertEqual(('completed', '1'), events[events.index(('started', '2')) - 1])
+        self.assertEqual(b'abcdef', b''.join(chunk for (event, chunk) in events[events.index(('started', '2')):] if event == 'received'))
+        self.assertEqual(('completed', '2'), events[-1])
+
+        first, second, third = parser.get(), parser.get(), parser.get()
+        self.assertEqual((b'', '1'), (first.body, first.headers['n']))
+        self.assertEqual((b'', '2'), (second.body, second.headers['n']))
+        self.assertIsInstance(third.body, StompFileBody) # not streamed, hence spooled
+        self.assertEqual(b'not streamed', third.body.tobytes())
+
+        class FailingStream(StompBodyStream):
+            def received(self, chunk):
+                raise RuntimeError('stream failed')
+        parser = StompParser(StompSpec.VERSION_1_1, stream=lambda frame: frame.headers.get('stream') and FailingStream(frame))
+        self.assertRaises(RuntimeError, parser.add, binaryType(withLength) + binaryType(notStreamed))
+        self.assertEqual(None, parser.get()) # the buffered data was discarded
+        parser.add(binaryType(notStreamed))
+        self.assertEqual(notStreamed, parser.get())
+
+    def test_lazy_headers(self):
+        frames = [
+            (StompSpec.VERSION_1_0, b'MESSAGE\nfoo:bar1\nfoo:bar2\n:empty-header\nempty-value:\ncontent-length:4\n\n\xf0\x00\n\t\x00'),
+            (StompSpec.VERSION_1_1, b'DISCONNECT\n\\n\\\\:\\c\t\\n\nfen\xc3\xaatre:\xc2\xbfqu\xc3\xa9 tal?\n\n\x00'),
+            (StompSpec.VERSION_1_2, b'SEND\r\ndestination:/queue/test\r\nfoo:\\r\r\n\r\nbody\x00'),
+            (StompSpec.VERSION_1_2, b'CONNECTED\nversion:1.2\nheart-beat:0,0\nserver:with:colon\n\n\x00')
+        ]
+        for (version, frameBytes) in frames:
+            parser = StompParser(version)
+            parser.add(frameBytes)
+            frame = parser.get()
+            parser = StompParser(version, lazyHeaders=True)
+            parser.add(frameBytes)
+            lazyFrame = parser.get()
+            for header in frame.headers:
+                self.assertEqual(lazyFrame.headers[header], frame.headers[header])
+            if sys.version_info[0] > 2: # Python 2 decodes all headers as soon as one is accessed
+                self.assertIsNone(lazyFrame._rawHeaders._rawHeaders)
+            self.assertNotIn('unknown', lazyFrame.headers)
+            self.assertEqual(lazyFrame.headers, frame.headers)
+            self.assertEqual(lazyFrame.rawHeaders, frame.rawHeaders)
+            self.assertEqual(lazyFrame, frame)
+            self.assertEqual(lazyFrame.body, frame.body)
+            self.assertEqual(repr(lazyFrame), repr(frame))
+
+        parser = StompParser(StompSpec.VERSION_1_1, lazyHeaders=True)
+        if sys.version_info[0] > 2: # Python 2 decodes all headers as soon as the parser looks up the content-length
+            parser.add(b'SEND\ndestination:/queue/test\nno separator\nbad escape:\\t\n\n\x00')
+            frame = parser.get()
+            self.assertEqual(frame.headers[StompSpec.DESTINATION_HEADER], '/queue/test')
+            self.assertRaises(StompFrameError, lambda: frame.headers['bad escape'])
+            self.assertRaises(StompFrameError, lambda: frame.rawHeaders)
+        self.assertRaises(StompFrameError, parser.add, b'HELLO\n\n\x00')
+
+    def test_lazy_headers_behave_like_a_dict(self):
+        frameBytes = b'MESSAGE\ndestination:/queue/test\nmessage-id:4711\nfoo:bar1\nfoo:bar2\n\nbody\x00'
+        parser = StompParser(StompSpec.VERSION_1_1)
+        parser.add(frameBytes)
+        frame = parser.get()
+
+        parser = StompParser(StompSpec.VERSION_1_1, lazyHeaders=True)
+        for _ in range(5):
+            parser.add(frameBytes)
+        lazyFrame = parser.get()
+        self.assertIsInstance(lazyFrame.headers, dict)
+        self.assertEqual(json.loads(json.dumps(lazyFrame.headers)), frame.headers)
+        self.assertEqual(dict(parser.get().headers), frame.headers)
+        self.assertEqual(parser.get().headers.copy(), frame.headers)
+
+        lazyFrame = parser.get()
+        self.assertEqual('/queue/test', lazyFrame.headers.setdefault(StompSpec.DESTINATION_HEADER, '/queue/other'))
+        self.assertEqual('bar1', lazyFrame.headers.setdefault('foo', 'baz'))
+        headers = lazyFrame.headers
+        headers['foo'] = 'baz'
+        self.assertEqual(dict(frame.headers, foo='baz'), headers)
+        self.assertEqual(frame.headers, lazyFrame.headers) # like any frame with raw headers, modifying its headers does not change the frame
+        self.assertEqual(binaryType(frame), binaryType(lazyFrame))
+
+        lazyFrame = parser.get()
+        headers = dict(lazyFrame.headers)
+        headers['foo'] = 'baz'
+        lazyFrame.unraw()
+        lazyFrame.headers['foo'] = 'baz'
+        self.assertEqual(headers, lazyFrame.headers)
+        self.assertEqual(StompFrame(StompSpec.MESSAGE, headers, b'body', version=StompSpec.VERSION_1_1), lazyFrame)
+
     def test_decode(self):
         key = b'fen\xc3\xaatre'.decode('utf-8')
         value = b'\xc2\xbfqu\xc3\xa9 tal?'.decode('utf-8')
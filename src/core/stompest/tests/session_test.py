@@ -22,6 +22,18 @@ class StompSessionTest(unittest.TestCase):
         self.assertRaises(StompProtocolError, lambda: StompSession(version='1.3'))
         self.assertRaises(StompProtocolError, lambda: session.send('', '', {}))
 
+    def test_session_sendMany(self):
+        session = StompSession(check=False)
+        frames = session.sendMany('/queue/foo', [b'one', b'two'], {'foo': 'bar'})
+        self.assertEqual(frames, [commands.send('/queue/foo', body, {'foo': 'bar'}) for body in (b'one', b'two')])
+
+        messages = [('/queue/foo', b'one', None), ('/queue/bar', b'two', {'foo': 'bar'})]
+        self.assertEqual(session.sendMany(messages), [commands.send(*message) for message in messages])
+        self.assertEqual(session.sendMany([]), [])
+
+        session = StompSession()
+        self.assertRaises(StompProtocolError, lambda: session.sendMany('/queue/foo', [b'one']))
+
     def test_session_connect(self):
         session = StompSession(StompSpec.VERSION_1_0, check=False)
         self.assertEqual(session.version, StompSpec.VERSION_1_0)
@@ -136,8 +148,10 @@ class StompSessionTest(unittest.TestCase):
         headersWithId2 = {StompSpec.ID_HEADER: 'bla3', 'bla4': 'bla5'}
         session.subscribe('bla2', headersWithId2)
 
+        self.assertEqual(list(session.subscriptions()), [(token, 'bla1', headers, None), (tokenWithId1, 'bla2', headersWithId1, None), ((StompSpec.ID_HEADER, 'bla3'), 'bla2', headersWithId2, None)])
         subscriptions = list(session.replay())
         self.assertEqual(subscriptions, [('bla1', headers, '4711', None), ('bla2', headersWithId1, None, None), ('bla2', headersWithId2, None, None)])
+        self.assertEqual(list(session.subscriptions()), [])
         self.assertEqual(list(session.replay()), [])
 
         context = object()
@@ -1,9 +1,11 @@
 import logging
 import unittest
 
+from stompest._backwards import binaryType
 from stompest.config import StompConfig
 from stompest.error import StompConnectionError, StompProtocolError
-from stompest.protocol import commands, StompFrame, StompSpec
+from stompest.protocol import commands, StompBodyStream, StompFrame, StompParser, StompSpec
+from stompest.protocol.frame import StompHeartBeat
 from stompest.sync import Stomp
 
 from stompest.tests import mock
@@ -80,6 +82,74 @@ class SimpleStompTest(unittest.TestCase):
         sentFrame = args[0]
         self.assertEqual(StompFrame(StompSpec.CONNECT, {StompSpec.LOGIN_HEADER: login, StompSpec.PASSCODE_HEADER: passcode}), sentFrame)
 
+    def test_connect_passes_socket_options(self):
+        socketOptions = [(6, 1, 1)]
+        config = StompConfig('tcp://%s:%s' % (HOST, PORT), check=False, socketOptions=socketOptions)
+        stomp = self._get_connect_mock(StompFrame(StompSpec.CONNECTED, {StompSpec.SESSION_HEADER: '4711'}), config)
+        stomp.connect()
+        _, kwargs = stomp._transportFactory.call_args
+        self.assertEqual(socketOptions, kwargs['socketOptions'])
+
+    def test_subscribe_stream(self):
+        chunks = []
+        class Stream(StompBodyStream):
+            def received(self, chunk):
+                chunks.append(chunk.tobytes())
+
+        stomp = self._get_connect_mock(StompFrame(StompSpec.CONNECTED, {StompSpec.SESSION_HEADER: '4711'}))
+        stomp.connect()
+        _, kwargs = stomp._transportFactory.call_args
+        parser = StompParser(StompSpec.VERSION_1_1, stream=kwargs['stream'])
+        streamed = stomp.subscribe('/queue/streamed', {StompSpec.ID_HEADER: '1'}, stream=Stream)
+        stomp.subscribe('/queue/plain', {StompSpec.ID_HEADER: '2'})
+
+        messages = [StompFrame(StompSpec.MESSAGE, {StompSpec.DESTINATION_HEADER: destination, StompSpec.SUBSCRIPTION_HEADER: token, StompSpec.MESSAGE_ID_HEADER: token}, b'body', version=StompSpec.VERSION_1_1) for (destination, token) in (('/queue/streamed', '1'), ('/queue/plain', '2'), ('/queue/unknown', '3'))]
+        parser.add(b''.join(binaryType(message) for message in messages))
+        self.assertEqual([b'body'], chunks)
+        self.assertEqual([b'', b'body', b'body'], [parser.get().body for _ in messages])
+
+        stomp.unsubscribe(streamed)
+        parser.add(binaryType(messages[0]))
+        self.assertEqual(b'body', parser.get().body)
+        self.assertEqual([b'body'], chunks)
+
+        stomp.subscribe('/queue/streamed', {StompSpec.ID_HEADER: '1'}, stream=Stream)
+        stomp.close(flush=False)
+        stomp.connect() # the subscriptions are replayed with their streams
+        parser.add(binaryType(messages[0]))
+        self.assertEqual(b'', parser.get().body)
+        self.assertEqual([b'body', b'body'], chunks)
+
+        stomp.close()
+        stomp.connect()
+        stomp.subscribe('/queue/streamed', {StompSpec.ID_HEADER: '1'})
+        parser.add(binaryType(messages[0]))
+        self.assertEqual(b'body', parser.get().body)
+        self.assertEqual([b'body', b'body'], chunks)
+
+    def test_dataWaiting(self):
+        stomp = Stomp(CONFIG)
+        self.assertFalse(stomp.dataWaiting())
+        stomp = self._get_transport_mock()
+        stomp._transport.dataWaiting.return_value = True
+        self.assertTrue(stomp.dataWaiting())
+        stomp._transport.dataWaiting.return_value = False
+        self.assertFalse(stomp.dataWaiting())
+
+    def test_writeFrames_does_not_close(self):
+        stomp = Stomp(CONFIG)
+        self.assertRaises(StompConnectionError, stomp.writeFrames, [StompHeartBeat()])
+        stomp = self._get_transport_mock()
+        transport = stomp._transport
+        frames = [StompHeartBeat()]
+        stomp.writeFrames(frames)
+        transport.writeFrames.assert_called_once_with(frames)
+        transport.connected = False # lost while the application thread is receiving
+        transport.writeFrames.side_effect = StompConnectionError('Could not send to connection')
+        self.assertRaises(StompConnectionError, stomp.writeFrames, frames)
+        self.assertIs(transport, stomp._Stomp__transport)
+        self.assertEqual(0, transport.disconnect.call_count)
+
     def test_send_writes_correct_frame(self):
         destination = '/queue/foo'
         message = b'test message'
@@ -90,6 +160,18 @@ class SimpleStompTest(unittest.TestCase):
         sentFrame = args[0]
         self.assertEqual(StompFrame('SEND', {StompSpec.DESTINATION_HEADER: destination, 'foo': 'bar', 'fuzz': 'ball'}, message), sentFrame)
 
+    def test_sendMany_writes_all_frames_at_once(self):
+        stomp = self._get_transport_mock()
+        stomp.session.sent = mock.Mock()
+        stomp.sendMany('/queue/foo', [b'one', b'two'], {'foo': 'bar'})
+        stomp.sendMany([('/queue/foo', b'three', None)])
+        self.assertEqual(0, stomp._transport.send.call_count)
+        self.assertEqual([
+            mock.call([StompFrame(StompSpec.SEND, {StompSpec.DESTINATION_HEADER: '/queue/foo', 'foo': 'bar'}, body) for body in (b'one', b'two')]),
+            mock.call([StompFrame(StompSpec.SEND, {StompSpec.DESTINATION_HEADER: '/queue/foo'}, b'three')])
+        ], stomp._transport.sendMany.call_args_list)
+        self.assertEqual(2, stomp.session.sent.call_count)
+
     def test_subscribe_writes_correct_frame(self):
         destination = '/queue/foo'
         headers = {'foo': 'bar', 'fuzz': 'ball'}
@@ -99,6 +181,78 @@ class SimpleStompTest(unittest.TestCase):
         sentFrame = args[0]
         self.assertEqual(StompFrame(StompSpec.SUBSCRIBE, {StompSpec.DESTINATION_HEADER: destination, 'foo': 'bar', 'fuzz': 'ball'}), sentFrame)
 
+    def test_send_does_not_poll_connection(self):
+        stomp = self._get_transport_mock()
+        stomp.send('/queue/foo', b'test message')
+        stomp.ack(StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711'}))
+        self.assertEqual(2, stomp._transport.send.call_count)
+        self.assertEqual(0, stomp._transport.canRead.call_count)
+
+    def test_lost_connection_closes_client(self):
+        stomp = self._get_transport_mock()
+        stomp.subscribe('/queue/foo')
+        transport = stomp._transport
+        transport.send.side_effect = StompConnectionError('Could not send to connection')
+        self.assertRaises(StompConnectionError, stomp.send, '/queue/foo', b'test message')
+        transport.connected = False
+        self.assertRaises(StompConnectionError, stomp.send, '/queue/foo', b'test message')
+        self.assertEqual(1, transport.disconnect.call_count)
+        self.assertRaises(StompConnectionError, lambda: stomp._transport)
+        self.assertEqual(len(list(stomp.session.replay())), 1) # subscriptions are not flushed
+
+    def test_flush(self):
+        stomp = self._get_transport_mock()
+        stomp.flush()
+        self.assertEqual(1, stomp._transport.flush.call_count)
+        stomp._session.version = StompSpec.VERSION_1_1
+        stomp.beat()
+        self.assertEqual(2, stomp._transport.flush.call_count)
+
+    def test_check(self):
+        stomp = self._get_transport_mock()
+        stomp._transport.canRead.return_value = False
+        stomp.check()
+        self.assertEqual([mock.call(0)], stomp._transport.canRead.call_args_list)
+
+        transport = stomp._transport
+        transport.canRead.side_effect = StompConnectionError('Connection closed [No more data]')
+        self.assertRaises(StompConnectionError, stomp.check)
+        self.assertEqual(1, transport.disconnect.call_count)
+        self.assertRaises(StompConnectionError, lambda: stomp._transport)
+
+    def test_receiveFrames(self):
+        frames = [StompFrame(StompSpec.MESSAGE, {'x': str(i)}, b'testing') for i in range(5)]
+        stomp = self._get_transport_mock()
+        stomp.session.received = mock.Mock()
+        transport = stomp._transport
+        transport.receiveBuffered.side_effect = [None, frames[1], StompHeartBeat(), frames[2], frames[3], None]
+        transport.receive.return_value = frames[0]
+        self.assertEqual(stomp.receiveFrames(maxFrames=3, timeout=1), frames[:3])
+        self.assertEqual(1, transport.canRead.call_count)
+        self.assertEqual(1, stomp.session.received.call_count)
+
+        transport.canRead.reset_mock()
+        self.assertEqual(stomp.receiveFrames(), frames[3:4])
+        self.assertEqual(0, transport.canRead.call_count)
+        self.assertEqual(2, stomp.session.received.call_count)
+
+        transport.receiveBuffered.side_effect = None
+        transport.receiveBuffered.return_value = None
+        transport.canRead.return_value = False
+        self.assertEqual(stomp.receiveFrames(timeout=0), [])
+        self.assertEqual([mock.call(0)], transport.canRead.call_args_list)
+        self.assertEqual(2, stomp.session.received.call_count)
+
+        stomp._messages.extend(frames[:2])
+        self.assertEqual(stomp.receiveFrames(maxFrames=1), frames[:1])
+        self.assertEqual(stomp.receiveFrames(), frames[1:2])
+        self.assertEqual(1, transport.canRead.call_count)
+
+        stomp._messages.extend(frames[:2])
+        self.assertEqual(stomp.receiveFrames(maxFrames=0), [])
+        self.assertEqual(list(stomp._messages), frames[:2])
+        self.assertEqual(1, transport.canRead.call_count)
+
     def test_subscribe_matching_and_corner_cases(self):
         destination = '/queue/foo'
         headers = {'foo': 'bar', 'fuzz': 'ball'}
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+import unittest
+
+from concurrent import futures
+
+from stompest.error import StompConnectionError, StompProtocolError
+from stompest.protocol import StompFrame, StompSpec
+from stompest.sync.dispatcher import prefetchSize, StompDispatcher, StompProcessDispatcher
+from stompest.util import MESSAGE_FAILED_HEADER
+
+from stompest.tests import mock
+
+logging.basicConfig(level=logging.DEBUG)
+
+def score(headers, body): # runs in a worker process
+    if body == b'3':
+        raise ValueError('bad message')
+    return headers, body
+
+class StompDispatcherTest(unittest.TestCase):
+    TIMEOUT = 5 # an upper bound for the waits below which is never reached unless the test fails
+
+    def _get_client_mock(self, frames, version=StompSpec.VERSION_1_1):
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(frame), StompSpec.SUBSCRIPTION_HEADER: '0'}, str(frame).encode(), version=version) if isinstance(frame, int) else frame for frame in frames]
+        client = mock.Mock()
+        client.canRead.side_effect = lambda timeout: bool(frames) or (time.sleep(timeout or 0) and False)
+        client.receiveFrame.side_effect = lambda: frames.pop(0)
+        client.message.return_value = (StompSpec.ID_HEADER, '0')
+        return client
+
+    def _acked(self, client, method='ack'):
+        return [args[0].headers[StompSpec.MESSAGE_ID_HEADER] for (args, _) in getattr(client, method).call_args_list]
+
+    def test_client_individual(self):
+        client = self._get_client_mock(range(10))
+        acked = dict((str(i), threading.Event()) for i in range(10))
+        client.ack.side_effect = lambda frame: acked[frame.headers[StompSpec.MESSAGE_ID_HEADER]].set()
+        def handler(frame):
+            later = str(int(frame.body) + 1)
+            if later in acked:
+                acked[later].wait(self.TIMEOUT) # later messages finish first
+        dispatcher = StompDispatcher(client, handler, maxInFlight=10)
+        dispatcher.run(timeout=0.1)
+        self.assertEqual(0, len(dispatcher))
+        self.assertEqual([str(i) for i in reversed(range(10))], self._acked(client))
+
+    def test_client_acks_contiguous_prefix(self):
+        client = self._get_client_mock(range(6))
+        released = dict((str(i), threading.Event()) for i in range(6))
+        done = dict((str(i), threading.Event()) for i in range(6))
+        processed, acked, ackCalled = [], [], threading.Event()
+        def handler(frame):
+            released[frame.body.decode()].wait(self.TIMEOUT)
+            processed.append(frame.body.decode())
+        def ack(frame):
+            acked.append((frame.headers[StompSpec.MESSAGE_ID_HEADER], list(processed)))
+            ackCalled.set()
+        client.ack.side_effect = ack
+        executor = futures.ThreadPoolExecutor(6)
+        def submit(fn, frame):
+            future = futures.ThreadPoolExecutor.submit(executor, fn, frame)
+            future.add_done_callback(lambda _: done[frame.body.decode()].set()) # only now may the dispatcher see the message as processed
+            return future
+        executor.submit = submit
+        dispatcher = StompDispatcher(client, handler, StompSpec.ACK_CLIENT, maxInFlight=6, executor=executor)
+        def release():
+            for i in ('2', '1', '3', '0', '5', '4'):
+                released[i].set()
+                done[i].wait(self.TIMEOUT)
+                if i in ('0', '4'): # the prefix is complete: wait for its ack before releasing more messages
+                    ackCalled.wait(self.TIMEOUT)
+                    ackCalled.clear()
+        thread = threading.Thread(target=release)
+        thread.start()
+        try:
+            dispatcher.run(timeout=0.1)
+        finally:
+            thread.join()
+            executor.shutdown()
+        self.assertEqual(['2', '1', '3', '0', '5', '4'], processed)
+        self.assertEqual([('3', ['2', '1', '3', '0']), ('5', ['2', '1', '3', '0', '5', '4'])], acked) # no ack before the prefix was complete
+
+    def test_max_in_flight(self):
+        client = self._get_client_mock(range(20))
+        running = []
+        maxRunning = []
+        lock = threading.Lock()
+        def handler(frame):
+            with lock:
+                running.append(frame)
+                maxRunning.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(frame)
+        StompDispatcher(client, handler, maxInFlight=3).run(timeout=0.1)
+        self.assertEqual(20, client.ack.call_count)
+        self.assertTrue(max(maxRunning) <= 3)
+
+    def test_failures(self):
+        client = self._get_client_mock(range(3))
+        def handler(frame):
+            if frame.body == b'1':
+                raise RuntimeError('poof')
+            if frame.body == b'2':
+                time.sleep(0.5)
+        StompDispatcher(client, handler, maxInFlight=3, timeout=0.1).run(timeout=0.1)
+        self.assertEqual(['0'], self._acked(client))
+        self.assertEqual(['1', '2'], sorted(self._acked(client, 'nack')))
+
+        client = self._get_client_mock(range(2))
+        StompDispatcher(client, handler, StompSpec.ACK_CLIENT, errorDestination='/queue/error').run(timeout=0.1)
+        self.assertEqual('1', self._acked(client)[-1])
+        (destination, body, headers), _ = client.send.call_args
+        self.assertEqual(('/queue/error', b'1'), (destination, body))
+        self.assertEqual(headers[MESSAGE_FAILED_HEADER], 'poof')
+        self.assertEqual(0, client.nack.call_count)
+
+        client = self._get_client_mock(range(2), StompSpec.VERSION_1_0)
+        StompDispatcher(client, handler).run(timeout=0.1)
+        self.assertEqual(['0', '1'], sorted(self._acked(client)))
+
+    def test_timed_out_handlers_count_against_max_in_flight(self):
+        client = self._get_client_mock(range(6))
+        released = threading.Event()
+        running, maxRunning = [], []
+        lock = threading.Lock()
+        def handler(frame):
+            with lock:
+                running.append(frame)
+                maxRunning.append(len(running))
+            if frame.body == b'0':
+                released.wait(self.TIMEOUT)
+            else:
+                time.sleep(0.02)
+            with lock:
+                running.remove(frame)
+        executor = futures.ThreadPoolExecutor(6) # more workers than maxInFlight, so that the dispatcher is the only bound
+        timer = threading.Timer(0.3, released.set)
+        timer.start()
+        try:
+            StompDispatcher(client, handler, maxInFlight=2, timeout=0.05, executor=executor).run(timeout=0.5)
+        finally:
+            timer.cancel()
+            released.set()
+            executor.shutdown()
+        self.assertEqual(2, max(maxRunning))
+        self.assertEqual(['0'], self._acked(client, 'nack'))
+        self.assertEqual(5, client.ack.call_count)
+
+    def test_connection_lost_while_draining(self):
+        error = StompFrame(StompSpec.ERROR, {'message': 'fail'})
+        client = self._get_client_mock([0, 1, error])
+        client.ack.side_effect = StompConnectionError('Not connected')
+        dispatcher = StompDispatcher(client, lambda frame: time.sleep(0.05))
+        self.assertRaises(StompProtocolError, dispatcher.run, 0.1) # not hidden by the failed ack
+        self.assertEqual(1, client.ack.call_count)
+        self.assertEqual(0, len(dispatcher))
+
+        client = self._get_client_mock([0, 1])
+        client.ack.side_effect = StompConnectionError('Not connected')
+        dispatcher = StompDispatcher(client, lambda frame: time.sleep(0.05))
+        self.assertRaises(StompConnectionError, dispatcher.run, 0.1)
+        self.assertEqual(0, len(dispatcher))
+
+    def test_auto_and_other_frames(self):
+        receipt = StompFrame(StompSpec.RECEIPT, {StompSpec.RECEIPT_ID_HEADER: '4711'})
+        error = StompFrame(StompSpec.ERROR, {'message': 'fail'})
+        client = self._get_client_mock([0, receipt, 1, error, 2])
+        handled = []
+        dispatcher = StompDispatcher(client, handled.append, StompSpec.ACK_AUTO)
+        self.assertRaises(StompProtocolError, dispatcher.run, 0.1)
+        self.assertEqual([b'0', b'1'], sorted(frame.body for frame in handled))
+        client.receipt.assert_called_once_with(receipt)
+        self.assertEqual(0, client.ack.call_count)
+
+        self.assertRaises(ValueError, StompDispatcher, client, None)
+        self.assertRaises(StompProtocolError, StompDispatcher, client, handled.append, 'manual')
+
+    def test_stop(self):
+        client = self._get_client_mock(range(5))
+        dispatcher = StompDispatcher(client, lambda frame: frame.body == b'1' and dispatcher.stop(), maxInFlight=1)
+        dispatcher.run()
+        self.assertTrue(2 <= client.ack.call_count < 5)
+
+    def test_process_dispatcher(self):
+        client = self._get_client_mock(range(6))
+        client.session.subscriptions.return_value = [
+            ((StompSpec.ID_HEADER, '0'), '/queue/foo', {'activemq.prefetchSize': '2'}, None),
+            ((StompSpec.ID_HEADER, '1'), '/queue/bar', {'prefetch-count': '3'}, None),
+            ((StompSpec.ID_HEADER, '2'), '/queue/baz', {}, None)
+        ]
+        dispatcher = StompProcessDispatcher(client, score)
+        self.assertEqual(5, dispatcher.maxInFlight)
+        dispatcher.run(timeout=0.1)
+        self.assertEqual(['0', '1', '2', '4', '5'], sorted(self._acked(client)))
+        self.assertEqual(['3'], self._acked(client, 'nack'))
+
+        client.session.subscriptions.return_value = []
+        self.assertEqual(StompDispatcher.MAX_IN_FLIGHT, StompProcessDispatcher(client, score).maxInFlight)
+
+        executor = mock.Mock()
+        dispatcher = StompProcessDispatcher(client, score, executor=executor)
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711'}, memoryview(b'body'))
+        dispatcher._submit(executor, frame)
+        executor.submit.assert_called_once_with(score, {StompSpec.MESSAGE_ID_HEADER: '4711'}, b'body')
+        self.assertIs(type(executor.submit.call_args[0][2]), bytes)
+
+    def test_prefetchSize(self):
+        self.assertEqual(100, prefetchSize({'activemq.prefetchSize': '100'}))
+        self.assertEqual(10, prefetchSize({'prefetch-count': 10}))
+        self.assertEqual(0, prefetchSize({'prefetch-count': 'many'}))
+        self.assertEqual(0, prefetchSize({}))
+        self.assertEqual(0, prefetchSize(None))
+
+if __name__ == '__main__':
+    unittest.main()
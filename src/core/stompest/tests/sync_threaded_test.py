@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+import unittest
+
+from stompest.config import StompConfig
+from stompest.error import StompConnectionError, StompProtocolError
+from stompest.protocol import commands, StompFrame, StompSpec
+from stompest.sync import HeartBeatThread, Stomp, ThreadSafeStomp
+
+from stompest.tests import mock
+
+logging.basicConfig(level=logging.DEBUG)
+
+CONFIG = StompConfig('tcp://fakeHost:61613', check=False)
+
+class ThreadSafeStompTest(unittest.TestCase):
+    def _get_shared_mock(self, **kwargs):
+        client = Stomp(CONFIG)
+        client._transport = mock.Mock()
+        return ThreadSafeStomp(client, **kwargs)
+
+    def _sent(self, shared):
+        return [frame for (args, _) in shared.client._Stomp__transport.writeFrames.call_args_list for frame in args[0]]
+
+    def test_send_from_many_threads(self):
+        shared = self._get_shared_mock(maxQueued=8, maxBatch=4)
+        shared.start()
+        def send(thread):
+            for i in range(50):
+                shared.send('/queue/%d' % thread, str(i).encode())
+        threads = [threading.Thread(target=send, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        shared.stop()
+
+        sent = self._sent(shared)
+        self.assertEqual(200, len(sent))
+        for thread in range(4):
+            destination = '/queue/%d' % thread
+            self.assertEqual([frame.body for frame in sent if frame.headers[StompSpec.DESTINATION_HEADER] == destination], [str(i).encode() for i in range(50)])
+        self.assertTrue(all(len(args[0]) <= 4 for (args, _) in shared.client._Stomp__transport.writeFrames.call_args_list))
+
+    def test_commands(self):
+        shared = self._get_shared_mock()
+        shared.client.session.version = StompSpec.VERSION_1_1
+        self.assertRaises(StompConnectionError, shared.send, '/queue/foo', b'test message')
+        shared.start()
+        self.assertRaises(StompConnectionError, shared.start)
+        message = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711', StompSpec.SUBSCRIPTION_HEADER: '0815'}, version=StompSpec.VERSION_1_1)
+        shared.send('/queue/foo', b'test message', receipt='4711')
+        shared.sendMany('/queue/bar', [b'one', b'two'])
+        shared.ack(message)
+        shared.nack(message)
+        shared.begin('4711')
+        shared.commit('4711')
+        shared.flush()
+        self.assertEqual(self._sent(shared), [
+            commands.send('/queue/foo', b'test message', receipt='4711', version=StompSpec.VERSION_1_1),
+            commands.send('/queue/bar', b'one', version=StompSpec.VERSION_1_1),
+            commands.send('/queue/bar', b'two', version=StompSpec.VERSION_1_1),
+            commands.ack(message),
+            commands.nack(message),
+            commands.begin('4711'),
+            commands.commit('4711')
+        ])
+        message.version = StompSpec.VERSION_1_0
+        self.assertRaises(StompProtocolError, shared.nack, message)
+        shared.stop()
+        shared.stop()
+
+    def test_writer_error(self):
+        shared = self._get_shared_mock()
+        transport = shared.client._Stomp__transport
+        transport.writeFrames.side_effect = StompConnectionError('Could not send to connection')
+        shared.start()
+        shared.send('/queue/foo', b'test message')
+        self.assertRaises(StompConnectionError, shared.flush)
+        self.assertRaises(StompConnectionError, shared.send, '/queue/foo', b'test message')
+        self.assertRaises(StompConnectionError, shared.stop)
+        self.assertEqual(1, transport.writeFrames.call_count)
+        self.assertIs(transport, shared.client._Stomp__transport) # the client is left to the application thread
+
+    def _get_reader_mock(self, frames, error=None, **kwargs):
+        shared = self._get_shared_mock(**kwargs)
+        shared.POLL_INTERVAL = 0.01
+        frames = list(frames)
+        def receiveFrames(maxFrames, timeout):
+            if frames:
+                batch = frames[:maxFrames]
+                del frames[:maxFrames]
+                return batch
+            if error:
+                raise error
+            time.sleep(timeout)
+            return []
+        shared.client.receiveFrames = mock.Mock(side_effect=receiveFrames)
+        return shared
+
+    def test_prefetch(self):
+        messages = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}) for i in range(10)]
+        shared = self._get_reader_mock(messages, maxPrefetch=3)
+        self.assertRaises(StompConnectionError, lambda: list(shared.frames(0)))
+        shared.start()
+        received = []
+        for frame in shared.frames(timeout=1):
+            time.sleep(0.01) # a slow consumer
+            received.append(frame)
+            if len(received) == len(messages):
+                break
+        self.assertEqual(messages, received)
+        self.assertTrue(all(args[0] <= 3 for (args, _) in shared.client.receiveFrames.call_args_list))
+        self.assertEqual([], list(shared.frames(timeout=0.05)))
+        shared.stop()
+        self.assertEqual([], list(shared.frames()))
+
+    def test_prefetch_error(self):
+        messages = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}) for i in range(2)]
+        shared = self._get_reader_mock(messages, StompConnectionError('Connection closed [No more data]'), maxPrefetch=10)
+        shared.start()
+        frames = shared.frames()
+        self.assertEqual(messages, [next(frames), next(frames)])
+        self.assertRaises(StompConnectionError, next, frames)
+        self.assertRaises(StompConnectionError, lambda: list(shared.frames()))
+        shared.stop()
+
+class HeartBeatThreadTest(unittest.TestCase):
+    TIMEOUT = 5 # an upper bound for the waits below which is never reached unless the test fails
+
+    def _get_client_mock(self, clientHeartBeat, serverHeartBeat):
+        client = mock.Mock()
+        session = client.session
+        session.clientHeartBeat, session.serverHeartBeat = clientHeartBeat, serverHeartBeat
+        session.lastSent = session.lastReceived = time.time()
+        self.beats, self.fourBeats, self.shutDown = [], threading.Event(), threading.Event()
+        def writeFrames(frames):
+            self.assertEqual([session.beat.return_value], frames)
+            session.lastSent = time.time()
+            self.beats.append(session.lastSent)
+            if len(self.beats) == 4:
+                self.fourBeats.set()
+        client.writeFrames.side_effect = writeFrames
+        client.shutdown.side_effect = self.shutDown.set
+        client.dataWaiting.return_value = False
+        return client
+
+    def test_client_heart_beat(self):
+        client = self._get_client_mock(50, 0)
+        heartBeats = HeartBeatThread(client)
+        heartBeats.start()
+        self.assertRaises(StompConnectionError, heartBeats.start)
+        self.assertTrue(self.fourBeats.wait(self.TIMEOUT))
+        heartBeats.stop()
+        beats = client.writeFrames.call_count
+        self.assertTrue(all((later - earlier) >= 0.035 for (earlier, later) in zip(self.beats, self.beats[1:])), self.beats) # 80 % of 50 ms (less some clock jitter)
+        time.sleep(0.1)
+        self.assertEqual(beats, client.writeFrames.call_count)
+        self.assertEqual(0, client.shutdown.call_count)
+        self.assertEqual([], client.beat.call_args_list) # may close the client
+        self.assertEqual([], client.sendFrame.call_args_list)
+        self.assertIs(None, heartBeats.error)
+
+    def test_server_heart_beat_timeout(self):
+        client = self._get_client_mock(0, 50)
+        client.session.lastReceived = lastReceived = time.time() + 0.1 # as if a frame were received in the meantime
+        heartBeats = HeartBeatThread(client, {'client': 0.8, 'server': 1.0})
+        heartBeats.start()
+        self.assertTrue(self.shutDown.wait(self.TIMEOUT))
+        self.assertTrue(time.time() >= lastReceived + 0.05)
+        heartBeats.stop()
+        self.assertEqual(1, client.shutdown.call_count)
+        self.assertIsInstance(heartBeats.error, StompConnectionError)
+
+    def test_server_heart_beats_waiting_to_be_received(self):
+        client = self._get_client_mock(0, 50)
+        client.session.lastReceived = time.time() - 10 # the application thread is busy and does not read
+        checks = []
+        def dataWaiting():
+            checks.append((time.time(), client.shutdown.call_count))
+            return len(checks) <= 3 # the broker's heart-beats are waiting in the socket, then the broker dies
+        client.dataWaiting.side_effect = dataWaiting
+        heartBeats = HeartBeatThread(client, {'client': 0.8, 'server': 1.0})
+        heartBeats.start()
+        self.assertTrue(self.shutDown.wait(self.TIMEOUT))
+        heartBeats.stop()
+        self.assertEqual(4, len(checks))
+        self.assertEqual([0, 0, 0, 0], [shutdowns for (_, shutdowns) in checks]) # the connection survived while data was waiting
+        self.assertTrue(all((later - earlier) >= 0.045 for ((earlier, _), (later, _)) in zip(checks, checks[1:])), checks) # no busy loop
+        self.assertIsInstance(heartBeats.error, StompConnectionError)
+
+    def test_beat_error(self):
+        client = self._get_client_mock(10, 0)
+        client.writeFrames.side_effect = StompConnectionError('Could not send to connection')
+        heartBeats = HeartBeatThread(client)
+        heartBeats.start()
+        self.assertTrue(self.shutDown.wait(self.TIMEOUT))
+        heartBeats.stop()
+        self.assertEqual(1, client.writeFrames.call_count)
+        self.assertEqual(1, client.shutdown.call_count)
+        self.assertEqual([], client.close.call_args_list)
+
+    def test_no_heart_beating(self):
+        client = self._get_client_mock(0, 0)
+        heartBeats = HeartBeatThread(client)
+        heartBeats.start()
+        heartBeats._thread.join(self.TIMEOUT)
+        self.assertFalse(heartBeats._thread.is_alive())
+        heartBeats.stop()
+
+if __name__ == '__main__':
+    unittest.main()
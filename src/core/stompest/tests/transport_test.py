@@ -1,14 +1,19 @@
+import array
 import binascii
 import itertools
 import logging
+import os
 import select # @UnresolvedImport
+import socket
+import tempfile
 import unittest
 
 import sys
-from stompest._backwards import binaryType, makeBytesFromSequence
+from stompest._backwards import binaryType, joinBuffers, makeBytesFromSequence
 from stompest.error import StompConnectionError
-from stompest.protocol import StompFrame, StompSpec
-from stompest.sync.transport import StompFrameTransport
+from stompest.protocol import commands, StompFileBody, StompFrame, StompSpec
+from stompest.protocol.util import byteView
+from stompest.sync.transport import selectors, StompFrameTransport
 
 from stompest.tests import mock
 
@@ -30,7 +35,11 @@ class StompFrameTransportTest(unittest.TestCase):
         connected.return_value = True
         socket = transport._socket = mock.Mock()
         stream = self._generate_bytes(stream)
-        socket.recv = mock.Mock(wraps=lambda size: makeBytesFromSequence(itertools.islice(stream, size)))
+        def recv_into(buffer, size):
+            data = makeBytesFromSequence(itertools.islice(stream, size))
+            buffer[:len(data)] = data
+            return len(data)
+        socket.recv_into = mock.Mock(wraps=recv_into)
         return transport
 
     def _get_send_mock(self):
@@ -41,13 +50,187 @@ class StompFrameTransportTest(unittest.TestCase):
         return transport
 
     def test_send(self):
-        frame = StompFrame(StompSpec.MESSAGE)
+        frame = StompFrame(StompSpec.MESSAGE, body=b'body')
+
+        sent = []
+        def sendmsg(buffers):
+            sent.append(joinBuffers(buffers))
+            return len(sent[-1])
+
+        transport = self._get_send_mock()
+        transport._socket.sendmsg.side_effect = sendmsg
+        transport.send(frame)
+        self.assertEqual([binaryType(frame)], sent)
+        self.assertEqual(0, transport._socket.sendall.call_count)
+
+    def test_sendMany(self):
+        frames = [StompFrame(StompSpec.SEND, {StompSpec.DESTINATION_HEADER: '/queue/foo'}, body) for body in (b'one', b'', b'three')]
 
+        sent = []
+        def sendmsg(buffers):
+            sent.append(joinBuffers(buffers))
+            return len(sent[-1])
+
+        transport = self._get_send_mock()
+        transport._socket.sendmsg.side_effect = sendmsg
+        transport.sendMany(frames)
+        self.assertEqual([b''.join(binaryType(frame) for frame in frames)], sent)
+
+    def test_send_file_body(self):
+        with tempfile.TemporaryFile() as file_:
+            file_.write(b'skipped' + 100 * b'x')
+            file_.seek(7)
+            frame = commands.send('/queue/test', file_)
+            header, trailer = binaryType(frame).split(100 * b'x')
+
+            sent = []
+            def sendmsg(buffers):
+                sent.append(joinBuffers(buffers))
+                return len(sent[-1])
+
+            transport = self._get_send_mock()
+            socket_ = transport._socket
+            socket_.sendmsg.side_effect = sendmsg
+            def sendfile(file_, offset, count):
+                sent.append(b'<file>')
+                file_.seek(offset + count)
+                return count
+            socket_.sendfile.side_effect = sendfile
+            transport.send(frame)
+            self.assertEqual([header, b'<file>', trailer], sent)
+            socket_.sendfile.assert_called_once_with(file_, 7, 100)
+            self.assertEqual(7, file_.tell())
+
+            transport = self._get_send_mock()
+            transport._socket = mock.Mock(spec=['sendall', 'close']) # neither sendmsg nor sendfile
+            transport.JOIN_SIZE = 64
+            transport.send(frame)
+            sent = [args[0] for (args, _) in transport._socket.sendall.call_args_list]
+            self.assertEqual(binaryType(frame), b''.join(sent))
+            self.assertEqual([header, 64 * b'x', 36 * b'x', trailer], sent)
+            self.assertEqual(7, file_.tell())
+
+    def test_send_short_file_body(self):
+        with tempfile.TemporaryFile() as file_:
+            file_.write(10 * b'x')
+            file_.seek(2)
+            frame = commands.send('/queue/test', StompFileBody(file_, size=100))
+
+            transport = self._get_send_mock()
+            socket_ = transport._socket
+            socket_.sendmsg.side_effect = lambda buffers: sum(len(data) for data in buffers)
+            socket_.sendfile.return_value = 8
+            self.assertRaises(StompConnectionError, transport.send, frame)
+            socket_.close.assert_called_once_with()
+            self.assertEqual(2, file_.tell())
+
+            transport = self._get_send_mock()
+            socket_ = transport._socket = mock.Mock(spec=['sendall', 'close'])
+            self.assertRaises(StompConnectionError, transport.send, frame)
+            socket_.close.assert_called_once_with()
+            self.assertEqual(2, file_.tell())
+
+    def test_dataWaiting(self):
         transport = self._get_send_mock()
+        transport._socket = None
+        self.assertFalse(transport.dataWaiting())
+
+        client, server = socket.socketpair()
+        try:
+            transport._socket = client
+            self.assertFalse(transport.dataWaiting())
+            server.sendall(binaryType(StompFrame(StompSpec.MESSAGE)))
+            self.assertTrue(transport.dataWaiting())
+            self.assertTrue(transport.dataWaiting()) # nothing was consumed
+            self.assertEqual(StompFrame(StompSpec.MESSAGE), transport.receive())
+            self.assertFalse(transport.dataWaiting())
+            client.close()
+            self.assertFalse(transport.dataWaiting())
+        finally:
+            server.close()
+
+    @unittest.skipIf(PY_VERSION < (3, 2), 'socket.socket(fileno=...) is new in Python 3.2')
+    def test_dataWaiting_beyond_fd_setsize(self):
+        fileno = 1103
+        try:
+            import resource # @UnresolvedImport
+        except ImportError:
+            raise unittest.SkipTest('no resource module')
+        if resource.getrlimit(resource.RLIMIT_NOFILE)[0] <= fileno:
+            raise unittest.SkipTest('file descriptor limit too low')
+
+        client, server = socket.socketpair()
+        try:
+            os.dup2(client.fileno(), fileno)
+            client.close()
+            client = socket.socket(fileno=fileno)
+            transport = self._get_send_mock()
+            transport._socket = client
+            self.assertFalse(transport.dataWaiting())
+            server.sendall(binaryType(StompFrame(StompSpec.MESSAGE)))
+            self.assertTrue(transport.dataWaiting())
+        finally:
+            client.close()
+            server.close()
+
+    def test_shutdown(self):
+        transport = self._get_send_mock()
+        socket_ = transport._socket
+        transport.shutdown()
+        socket_.shutdown.assert_called_once_with(socket.SHUT_RDWR)
+        socket_.shutdown.side_effect = IOError('not connected')
+        transport.shutdown()
+        transport._socket = None
+        transport.shutdown()
+
+    def test_send_partial_writes(self):
+        frame = StompFrame(StompSpec.MESSAGE, body=b'some body')
+        sent = []
+        def sendmsg(buffers):
+            data = joinBuffers(buffers)[:3] # the socket accepts only three bytes at a time
+            sent.append(data)
+            return len(data)
+
+        transport = self._get_send_mock()
+        transport._socket.sendmsg.side_effect = sendmsg
         transport.send(frame)
-        self.assertEqual(1, transport._socket.sendall.call_count)
-        args, _ = transport._socket.sendall.call_args
-        self.assertEqual(binaryType(frame), args[0])
+        self.assertEqual(binaryType(frame), b''.join(sent))
+
+    def test_send_partial_writes_buffer_body(self):
+        frame = commands.send('/queue/test', array.array('i', range(1000)))
+        sent = []
+        def sendmsg(buffers):
+            data = joinBuffers(buffers)[:7] # the socket accepts only seven bytes at a time
+            sent.append(data)
+            return len(data)
+
+        transport = self._get_send_mock()
+        transport._socket.sendmsg.side_effect = sendmsg
+        transport.send(frame)
+        self.assertEqual(binaryType(frame), b''.join(sent))
+
+        transport = self._get_send_mock()
+        transport.sslContext = object()
+        transport.JOIN_SIZE = 2000
+        transport.send(frame)
+        sent = [args[0] for (args, _) in transport._socket.sendall.call_args_list]
+        self.assertEqual(binaryType(frame), joinBuffers(sent))
+        self.assertIn(byteView(frame.body).tobytes(), sent) # 4000 bytes (not 1000 items) exceed the join size
+
+    def test_send_without_sendmsg(self):
+        frame = StompFrame(StompSpec.MESSAGE, body=b'body')
+
+        transport = self._get_send_mock()
+        transport.sslContext = object()
+        transport.send(frame)
+        self.assertEqual(0, transport._socket.sendmsg.call_count)
+        self.assertEqual([mock.call(binaryType(frame))], transport._socket.sendall.call_args_list)
+
+        transport = self._get_send_mock()
+        transport.sslContext = object()
+        transport.JOIN_SIZE = 0
+        transport.send(frame)
+        self.assertEqual(binaryType(frame), joinBuffers(args[0] for (args, _) in transport._socket.sendall.call_args_list))
 
     def test_send_not_connected_raises(self):
         frame = StompFrame(StompSpec.MESSAGE)
@@ -55,7 +238,130 @@ class StompFrameTransportTest(unittest.TestCase):
         transport = self._get_send_mock()
         transport._connected.return_value = False
         self.assertRaises(StompConnectionError, transport.send, frame)
-        self.assertEqual(0, transport._socket.sendall.call_count)
+        self.assertEqual(0, transport._socket.sendmsg.call_count)
+
+    def test_buffered_send(self):
+        frames = [StompFrame(StompSpec.SEND, {'n': str(n)}, b'body') for n in range(3)]
+        size = len(binaryType(frames[0]))
+        sent = []
+        def sendmsg(buffers):
+            sent.append(joinBuffers(buffers))
+            return len(sent[-1])
+
+        transport = self._get_send_mock()
+        transport.writeBufferSize = 2 * size
+        socket = transport._socket
+        socket.sendmsg.side_effect = sendmsg
+        transport.send(frames[0])
+        self.assertEqual([], sent)
+        transport.send(frames[1])
+        self.assertEqual([binaryType(frames[0]) + binaryType(frames[1])], sent)
+        transport.send(frames[2])
+        transport.flush()
+        transport.flush()
+        self.assertEqual([binaryType(frames[0]) + binaryType(frames[1]), binaryType(frames[2])], sent)
+
+        transport.send(frames[0])
+        transport._selector = mock.Mock()
+        transport._selector.select.return_value = []
+        self.assertFalse(transport.canRead(0))
+        self.assertEqual(binaryType(frames[0]), sent[-1])
+
+        transport.send(frames[1])
+        transport.disconnect()
+        self.assertEqual(binaryType(frames[1]), sent[-1])
+        self.assertEqual(1, socket.close.call_count)
+
+    def test_buffered_send_many_frames(self):
+        frames = [StompFrame(StompSpec.SEND, {'n': str(n)}, b'body') for n in range(1000)]
+        sent = []
+        def sendmsg(buffers):
+            self.assertTrue(len(buffers) <= transport.MAX_BUFFERS)
+            sent.append(joinBuffers(buffers[:100])[:1000]) # a partial write
+            return len(sent[-1])
+
+        transport = self._get_send_mock()
+        transport.writeBufferSize = 1000000
+        transport._socket.sendmsg.side_effect = sendmsg
+        for frame in frames:
+            transport.send(frame)
+        transport.flush()
+        self.assertEqual(b''.join(binaryType(frame) for frame in frames), b''.join(sent))
+
+    def test_buffered_send_mutable_body(self):
+        body = bytearray(b'body')
+        frame = StompFrame(StompSpec.SEND, body=body)
+        expected = binaryType(frame)
+        sent = []
+        def sendmsg(buffers):
+            sent.append(joinBuffers(buffers))
+            return len(sent[-1])
+
+        transport = self._get_send_mock()
+        transport.writeBufferSize = 1000
+        transport._socket.sendmsg.side_effect = sendmsg
+        transport.send(frame)
+        body[:] = b'next'
+        transport.flush()
+        self.assertEqual([expected], sent)
+
+    def test_buffered_send_error(self):
+        frame = StompFrame(StompSpec.SEND, body=b'body')
+
+        transport = self._get_send_mock()
+        transport.writeBufferSize = 1000
+        socket = transport._socket
+        socket.sendmsg.side_effect = IOError('Broken pipe')
+        transport.send(frame)
+        self.assertRaises(StompConnectionError, transport.flush)
+        self.assertEqual(1, socket.close.call_count)
+        transport.flush()
+
+    def test_send_while_closed_by_other_thread(self):
+        frame = StompFrame(StompSpec.MESSAGE, body=b'body')
+        transport = self._get_send_mock()
+        calls = []
+        def sendmsg(buffers):
+            calls.append(buffers)
+            if len(calls) == 1: # a partial write, meanwhile the reader thread fails and closes the connection
+                transport._close()
+                return 1
+            raise IOError('Bad file descriptor')
+
+        transport._socket.sendmsg.side_effect = sendmsg
+        self.assertRaises(StompConnectionError, transport.send, frame)
+        self.assertEqual(2, len(calls))
+        self.assertRaises(StompConnectionError, transport.send, frame) # not connected (although _connected is mocked)
+
+    def test_send_error_disconnects(self):
+        frame = StompFrame(StompSpec.MESSAGE)
+
+        transport = self._get_send_mock()
+        socket = transport._socket
+        socket.sendmsg.side_effect = IOError('Broken pipe')
+        self.assertRaises(StompConnectionError, transport.send, frame)
+        self.assertEqual(1, socket.close.call_count)
+        self.assertEqual(None, transport._socket)
+
+    def test_writeFrames(self):
+        frames = [StompFrame(StompSpec.SEND, body=b'one'), StompFrame(StompSpec.SEND, body=b'two')]
+        transport = self._get_send_mock()
+        transport.writeBufferSize = 1000
+        sent = []
+        transport._socket.sendmsg.side_effect = lambda buffers: sent.append(joinBuffers(buffers)) or len(sent[-1])
+        transport.send(frames[0])
+        transport.writeFrames(frames[1:])
+        self.assertEqual([binaryType(frames[0]) + binaryType(frames[1])], sent)
+
+    def test_writeFrames_error_shuts_down(self):
+        frame = StompFrame(StompSpec.SEND, body=b'body')
+        transport = self._get_send_mock()
+        socket_ = transport._socket
+        socket_.sendmsg.side_effect = IOError('Broken pipe')
+        self.assertRaises(StompConnectionError, transport.writeFrames, [frame])
+        socket_.shutdown.assert_called_once_with(socket.SHUT_RDWR)
+        self.assertEqual(0, socket_.close.call_count) # left to the thread which receives from the connection
+        self.assertIs(socket_, transport._socket)
 
     def test_receive(self):
         headers = {'x': 'y'}
@@ -64,7 +370,7 @@ class StompFrameTransportTest(unittest.TestCase):
         transport = self._get_receive_mock(binaryType(frame))
         frame_ = transport.receive()
         self.assertEqual(frame, frame_)
-        self.assertEqual(1, transport._socket.recv.call_count)
+        self.assertEqual(1, transport._socket.recv_into.call_count)
 
         self.assertRaises(StompConnectionError, transport.receive)
         self.assertEqual(transport._socket, None)
@@ -85,7 +391,7 @@ class StompFrameTransportTest(unittest.TestCase):
         self.assertEqual(frame, frame_)
         frame_ = transport.receive()
         self.assertEqual(frame, frame_)
-        self.assertEqual(1, transport._socket.recv.call_count)
+        self.assertEqual(1, transport._socket.recv_into.call_count)
 
         self.assertRaises(StompConnectionError, transport.receive)
         self.assertEqual(transport._socket, None)
@@ -98,7 +404,7 @@ class StompFrameTransportTest(unittest.TestCase):
         transport = self._get_receive_mock(binaryType(frame))
         frame_ = transport.receive()
         self.assertEqual(frame, frame_)
-        self.assertEqual(1, transport._socket.recv.call_count)
+        self.assertEqual(1, transport._socket.recv_into.call_count)
 
         self.assertRaises(StompConnectionError, transport.receive)
         self.assertEqual(transport._socket, None)
@@ -115,17 +421,103 @@ class StompFrameTransportTest(unittest.TestCase):
         self.assertEqual(StompSpec.MESSAGE, frame.command)
         self.assertEqual(headers, frame.headers)
         self.assertEqual(body1, frame.body)
-        self.assertEqual(1, transport._socket.recv.call_count)
+        self.assertEqual(1, transport._socket.recv_into.call_count)
 
         frame = transport.receive()
         self.assertEqual(StompSpec.MESSAGE, frame.command)
         self.assertEqual(headers, frame.headers)
         self.assertEqual(body2, frame.body)
-        self.assertEqual(1, transport._socket.recv.call_count)
+        self.assertEqual(1, transport._socket.recv_into.call_count)
 
         self.assertRaises(StompConnectionError, transport.receive)
         self.assertEqual(transport._socket, None)
 
+    def test_canRead_uses_registered_selector(self):
+        transport = self._get_receive_mock(b'')
+        selector = transport._selector = mock.Mock()
+        selector.select.return_value = []
+        with mock.patch('select.select') as select_call:
+            self.assertFalse(transport.canRead(0.5))
+            selector.select.return_value = [(mock.Mock(), 1)]
+            self.assertTrue(transport.canRead())
+            self.assertEqual(0, select_call.call_count)
+        self.assertEqual([mock.call(0.5), mock.call(None)], selector.select.call_args_list)
+
+    def test_canRead_ssl_pending(self):
+        transport = self._get_receive_mock(b'')
+        transport.sslContext = mock.Mock()
+        selector = transport._selector = mock.Mock()
+        transport._socket.pending.return_value = 42
+        self.assertTrue(transport.canRead())
+        self.assertEqual(0, selector.select.call_count)
+
+        transport._socket.pending.return_value = 0
+        selector.select.return_value = []
+        self.assertFalse(transport.canRead(0))
+        self.assertEqual(1, selector.select.call_count)
+
+    def test_connect_registers_selector(self):
+        if selectors is None:
+            return
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        transport = StompFrameTransport('127.0.0.1', server.getsockname()[1])
+        try:
+            transport.connect()
+            connection, _ = server.accept()
+            self.assertFalse(transport.canRead(0))
+            connection.sendall(binaryType(StompFrame(StompSpec.MESSAGE)))
+            self.assertTrue(transport.canRead(1))
+            self.assertEqual(StompFrame(StompSpec.MESSAGE), transport.receive())
+            selector = transport._selector
+            transport.disconnect()
+            self.assertEqual(None, transport._selector)
+            self.assertEqual(None, selector.get_map()) # closed
+            connection.close()
+        finally:
+            server.close()
+
+    def test_connect_sets_socket_options(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        transport = StompFrameTransport('127.0.0.1', server.getsockname()[1], socketOptions=[
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ])
+        try:
+            transport.connect()
+            self.assertTrue(transport._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+            self.assertTrue(transport._socket.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+            transport.disconnect()
+
+            transport.socketOptions = [(socket.SOL_SOCKET, -1, 1)]
+            self.assertRaises(StompConnectionError, transport.connect)
+        finally:
+            server.close()
+
+    def test_adaptive_read_size(self):
+        frame = StompFrame(StompSpec.MESSAGE, body=100000 * b'x')
+        transport = self._get_receive_mock(3 * binaryType(frame))
+        transport.maxReadSize = 32768
+        for _ in range(3):
+            self.assertEqual(frame, transport.receive())
+        sizes = [args[1] for (args, _) in transport._socket.recv_into.call_args_list]
+        self.assertEqual([4096, 8192, 16384, 32768, 32768], sizes[:5])
+        self.assertEqual(32768, max(sizes))
+        stats = transport.stats
+        self.assertEqual(len(sizes), stats.receives)
+        self.assertEqual(3 * len(binaryType(frame)), stats.bytesReceived)
+        self.assertEqual(stats.bytesReceived / float(stats.receives), stats.bytesPerReceive)
+
+        transport._received(100) # a short read
+        self.assertEqual(stats.readSize, 16384)
+        transport._selector = mock.Mock()
+        transport._selector.select.return_value = []
+        self.assertFalse(transport.canRead(0))
+        self.assertEqual(transport.READ_SIZE, stats.readSize)
+
     def test_retry_eintr_once_on_python2(self):
         if PY_VERSION[0] == 2:
             def raise_eintr():
@@ -1,6 +1,9 @@
+import tempfile
 import unittest
 
-from stompest.util import filterReservedHeaders
+from stompest._backwards import readOnly
+from stompest.protocol import StompFileBody, StompFrame, StompSpec
+from stompest.util import cloneFrame, filterReservedHeaders
 
 class UtilTest(unittest.TestCase):
     def test_filterReservedHeaders(self):
@@ -12,5 +15,21 @@ class UtilTest(unittest.TestCase):
         self.assertFalse('timestamp' in filteredHdrs)
         self.assertTrue('foo' in filteredHdrs)
 
+    def test_cloneFrame(self):
+        body = readOnly(memoryview(bytearray(b'zero-copy body')))
+        frame = StompFrame(StompSpec.MESSAGE, rawHeaders=[('message-id', '4711'), ('foo', 'bar')], body=body)
+        clonedFrame = cloneFrame(frame, persistent=True)
+        self.assertEqual(clonedFrame, StompFrame(StompSpec.MESSAGE, {'foo': 'bar', 'persistent': 'true'}, b'zero-copy body'))
+        self.assertIs(frame.body, body)
+        self.assertEqual(frame.rawHeaders, [('message-id', '4711'), ('foo', 'bar')])
+
+        with tempfile.TemporaryFile() as file_:
+            file_.write(b'spooled body')
+            file_.seek(0)
+            frame = StompFrame(StompSpec.MESSAGE, {'message-id': '4711'}, StompFileBody(file_))
+            clonedFrame = cloneFrame(frame)
+            self.assertIs(frame.body, clonedFrame.body)
+            self.assertEqual({}, clonedFrame.headers)
+
 if __name__ == '__main__':
     unittest.main()
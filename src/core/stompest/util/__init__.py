@@ -3,7 +3,9 @@ import functools
 import sys
 
 from stompest._backwards import textType
-from stompest.protocol import StompSpec
+from stompest.protocol import StompFileBody, StompSpec
+
+MESSAGE_FAILED_HEADER = 'message-failed'
 
 _RESERVED_HEADERS = set([StompSpec.MESSAGE_ID_HEADER, StompSpec.DESTINATION_HEADER, 'timestamp', 'expires', 'priority'])
 
@@ -20,7 +22,12 @@ def checkattr(attribute):
     return _checkattr
 
 def cloneFrame(frame, persistent=None):
-    frame = copy.deepcopy(frame)
+    memo = {}
+    if isinstance(frame.body, memoryview): # a zero-copy body references the parser's receive buffer and cannot be copied as it is
+        memo[id(frame.body)] = frame.body.tobytes()
+    elif isinstance(frame.body, StompFileBody): # a spooled body is shared: the clone streams it from the same file
+        memo[id(frame.body)] = frame.body
+    frame = copy.deepcopy(frame, memo)
     frame.unraw()
     headers = filterReservedHeaders(frame.headers)
     if persistent is not None: